@@ -1,24 +1,59 @@
+import asyncio
 from uuid import uuid4
 from time import time
-from fastapi import APIRouter, Depends, HTTPException
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Request, Query
 from pydantic import BaseModel
 from sse_starlette.sse import EventSourceResponse
-from app.db import get_redis, create_chat, chat_exists, add_chat_messages
+from starlette.background import BackgroundTask
+from app.db import create_chat, start_chat_turn, list_chats
 from app.assistants.assistant import RAGAssistant
+from app.utils.metrics import active_streams
+from app.config import settings
 
 class ChatIn(BaseModel):
     message: str
 
-# گرفتن Redis از تنظیمات
-async def get_rdb():
-    rdb = get_redis()
-    try:
-        yield rdb
-    finally:
-        await rdb.aclose()
+# کلاینت Redis مشترک که در lifespan روی connection pool ساخته شده
+def get_rdb(request: Request):
+    return request.app.state.rdb
 
 router = APIRouter()
 
+class DrainingEventSourceResponse(EventSourceResponse):
+    """SSE response that stays open through server shutdown until its reply is done or `drain_timeout` passes.
+
+    sse-starlette ends every stream as soon as the exit signal fires, which would cancel in-flight replies
+    long before the lifespan gets to drain them.
+    """
+
+    def __init__(self, content, drain_timeout, **kwargs):
+        super().__init__(content, **kwargs)
+        self.drain_timeout = drain_timeout
+
+    async def _listen_for_exit_signal(self):
+        await super()._listen_for_exit_signal()
+        # اگر استریم زودتر تمام شود این انتظار همراه با آن لغو می‌شود
+        await asyncio.sleep(self.drain_timeout)
+
+def parse_cursor(cursor):
+    try:
+        created, skip = cursor.split(':')
+        return int(created), int(skip)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f'Invalid cursor {cursor}')
+
+# 📌 لیست چت‌ها از جدید به قدیم، صفحه به صفحه و فقط با فیلدهای خلاصه
+@router.get('/chats')
+async def get_chats(
+    cursor: Optional[str] = None, limit: int = Query(20, ge=1, le=100), rdb = Depends(get_rdb)
+):
+    chats, next_cursor = await list_chats(rdb, parse_cursor(cursor) if cursor else None, page_size=limit)
+    return {
+        'chats': chats,
+        'next_cursor': f'{next_cursor[0]}:{next_cursor[1]}' if next_cursor else None
+    }
+
 # 📌 ساخت چت جدید
 @router.post('/chats')
 async def create_new_chat(rdb = Depends(get_rdb)):
@@ -29,38 +64,50 @@ async def create_new_chat(rdb = Depends(get_rdb)):
 
 # 📌 ارسال پیام به چت و دریافت پاسخ به صورت استریم + ذخیره پیام‌ها
 @router.post('/chats/{chat_id}')
-async def chat(chat_id: str, chat_in: ChatIn):
-    rdb = get_redis()
-
-    if not await chat_exists(rdb, chat_id):
-        raise HTTPException(status_code=404, detail=f'Chat {chat_id} does not exist')
+async def chat(chat_id: str, chat_in: ChatIn, request: Request, rdb = Depends(get_rdb)):
+    generations = request.app.state.generations
+    if not generations.reserve():
+        raise HTTPException(status_code=503, detail='Too many concurrent chats, please retry shortly')
 
-    # ✅ ذخیره پیام کاربر با timestamp
-    await add_chat_messages(rdb, chat_id, [{
-        'role': 'user',
-        'content': chat_in.message,
-        'created': int(time())
-    }])
+    # ✅ بررسی وجود چت، دریافت تاریخچه و خلاصه و ذخیره پیام کاربر در یک رفت‌وبرگشت
+    # تا وقتی تسک تولید پاسخ شروع نشده، هر خطایی باید جای رزرو شده را آزاد کند
+    assistant = None
+    try:
+        assistant = RAGAssistant(chat_id=chat_id, rdb=rdb, generations=generations)
+        chat_state = await start_chat_turn(rdb, chat_id, {
+            'role': 'user',
+            'content': chat_in.message,
+            'created': int(time())
+        }, last_n=assistant.context.fetch_size)
+        if chat_state is None:
+            raise HTTPException(status_code=404, detail=f'Chat {chat_id} does not exist')
 
-    assistant = RAGAssistant(chat_id=chat_id, rdb=rdb)
-    sse_stream = assistant.run(message=chat_in.message)
+        # پاسخ دستیار یک بار در پایان استریم توسط خود دستیار ذخیره می‌شود
+        sse_stream = assistant.run(message=chat_in.message, chat=chat_state)
+    except BaseException:
+        # بعد از شروع تسک، آزاد کردن جای رزرو با خود registry است
+        if assistant is None or assistant.task is None:
+            generations.release()
+        raise
 
-    latest_response = {"content": ""}
+    completed = False
 
-    # ✅ استریم پاسخ دستیار و ذخیره پیام نهایی پس از پایان
     async def event_generator():
-        async for event in sse_stream:
-            if isinstance(event.data, dict) and "content" in event.data:
-                latest_response["content"] += event.data["content"]
-            yield event
-
-        # ✅ ذخیره پاسخ دستیار در Redis
-        await add_chat_messages(rdb, chat_id, [{
-            'role': 'assistant',
-            'content': latest_response["content"],
-            'created': int(time())
-        }])
-
-    return EventSourceResponse(event_generator(), background=rdb.aclose)
+        nonlocal completed
+        active_streams.inc()
+        try:
+            async for event in sse_stream:
+                yield event
+            completed = True
+        finally:
+            active_streams.dec()
 
+    # ✅ اگر کلاینت قبل از پایان استریم قطع شود (یا مهلت خاموش شدن سرور تمام شود)، تولید پاسخ و استریم OpenAI هم متوقف می‌شود
+    def cancel_if_disconnected():
+        if not completed:
+            assistant.cancel()
 
+    return DrainingEventSourceResponse(
+        event_generator(), drain_timeout=settings.GENERATION_DRAIN_TIMEOUT,
+        background=BackgroundTask(cancel_if_disconnected)
+    )
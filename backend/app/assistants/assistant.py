@@ -1,86 +1,193 @@
+import re
+import json
 import asyncio
 from openai import pydantic_function_tool
-from time import time
-from app.openai import chat_stream
-from app.db import get_chat_messages, add_chat_messages
-from app.assistants.tools import QueryKnowledgeBaseTool
+from time import time, perf_counter
+from app.openai import chat_stream, get_embedding
+from app.db import (
+    add_chat_messages, save_chat_summary, get_catalog_version, search_answer_cache, save_cached_answer
+)
+from app.assistants.tools import QueryKnowledgeBaseTool, run_knowledge_base_queries
 from app.assistants.prompts import MAIN_SYSTEM_PROMPT, RAG_SYSTEM_PROMPT
+from app.assistants.context import ContextBuilder
 from app.utils.sse_stream import SSEStream
+from app.utils.metrics import (
+    span, time_to_first_token, llm_tokens, tool_calls_per_turn, chat_turns, context_tokens
+)
+from app.config import settings
 
 class RAGAssistant:
-    def __init__(self, chat_id, rdb, history_size=15, max_tool_calls=3):
+    def __init__(self, chat_id, rdb, history_size=15, max_tool_calls=3, generations=None):
         self.chat_id = chat_id
         self.rdb = rdb
+        self.generations = generations
         self.sse_stream = None
+        self.task = None
         self.main_system_message = {'role': 'system', 'content': MAIN_SYSTEM_PROMPT}
         self.rag_system_message = {'role': 'system', 'content': RAG_SYSTEM_PROMPT}
         self.tools_schema = [pydantic_function_tool(QueryKnowledgeBaseTool)]
         self.history_size = history_size
         self.max_tool_calls = max_tool_calls
+        self.context = ContextBuilder(history_size=history_size)
+        self.usage = {'prompt_tokens': 0, 'completion_tokens': 0}
 
-    async def _generate_chat_response(self, system_message, chat_messages, **kwargs):
+    async def _generate_chat_response(self, system_message, chat_messages, call='main', **kwargs):
          messages = [system_message, *chat_messages]
-         async with chat_stream(messages=messages, **kwargs) as stream:
-            async for event in stream:
-                if event.type == 'content.delta':
-                    await self.sse_stream.send(event.delta)
-            
-            final_completion = await stream.get_final_completion()
-            assistant_message = final_completion.choices[0].message
-            return assistant_message
+         start = perf_counter()
+         first_token = True
+         with span(f'llm.{call}'):
+            async with chat_stream(messages=messages, **kwargs) as stream:
+                async for event in stream:
+                    if event.type == 'content.delta':
+                        if first_token:
+                            time_to_first_token.observe(perf_counter() - start, call=call)
+                            first_token = False
+                        await self.sse_stream.send(event.delta)
+
+                final_completion = await stream.get_final_completion()
+         if final_completion.usage:
+            llm_tokens.inc(final_completion.usage.prompt_tokens, call=call, direction='in')
+            llm_tokens.inc(final_completion.usage.completion_tokens, call=call, direction='out')
+            self.usage['prompt_tokens'] += final_completion.usage.prompt_tokens
+            self.usage['completion_tokens'] += final_completion.usage.completion_tokens
+         assistant_message = final_completion.choices[0].message
+         return assistant_message
     
-    async def _handle_tool_calls(self, tool_calls, chat_messages):
-        for tool_call in tool_calls[:self.max_tool_calls]:
-            # There is only one tool in our RAGAssistant, the QueryKnowledgeBaseTool
-            kb_tool = tool_call.function.parsed_arguments
-            kb_result = await kb_tool(self.rdb)
+    async def _handle_tool_calls(self, tool_calls, chat_messages, catalog_version=None):
+        tool_calls = tool_calls[:self.max_tool_calls]
+        # There is only one tool in our RAGAssistant, the QueryKnowledgeBaseTool
+        with span('kb.queries'):
+            kb_results = await run_knowledge_base_queries(
+                self.rdb, [tool_call.function.parsed_arguments for tool_call in tool_calls], catalog_version
+            )
+        kb_results = self.context.fit_tool_results(kb_results, chat_messages)
+        for tool_call, kb_result in zip(tool_calls, kb_results):
             chat_messages.append(
                 {'role': 'tool', 'tool_call_id': tool_call.id, 'content': kb_result}
             )
         return await self._generate_chat_response(
             system_message=self.rag_system_message,
             chat_messages=chat_messages,
+            call='rag'
         )
     
-    async def _run_conversation_step(self, message):
-        user_db_message = {'role': 'user', 'content': message, 'created': int(time())}
-        chat_messages = await get_chat_messages(self.rdb, self.chat_id, last_n=self.history_size)
-        chat_messages.append({'role': 'user', 'content': message})
+    async def _lookup_cached_answer(self, message):
+        """Return the cache entry for a first-turn question; its answer is None on a miss."""
+        entry = {
+            'query_vector': await get_embedding(message, rdb=self.rdb),
+            'catalog_version': await get_catalog_version(self.rdb),
+            'answer': None
+        }
+        match = await search_answer_cache(self.rdb, entry['query_vector'], entry['catalog_version'])
+        if match is not None and match[0] >= settings.ANSWER_CACHE_THRESHOLD:
+            entry['answer'] = match[1]
+        return entry
+
+    async def _replay_answer(self, answer):
+        for piece in re.findall(r'\s*\S+', answer):
+            await self.sse_stream.send(piece)
+
+    async def _run_conversation_step(self, message, chat):
+        # کش معنایی فقط برای پیام اول چت که به تاریخچه وابسته نیست
+        cache_entry = None
+        if settings.ANSWER_CACHE_ENABLED and chat['offset'] == 0 and not chat['messages']:
+            try:
+                with span('answer_cache.lookup'):
+                    cache_entry = await self._lookup_cached_answer(message)
+            except Exception as e:
+                print(f'Error looking up answer cache: {str(e)}')
+        if cache_entry and cache_entry['answer'] is not None:
+            await self._replay_answer(cache_entry['answer'])
+            await add_chat_messages(self.rdb, self.chat_id, [{
+                'role': 'assistant',
+                'content': cache_entry['answer'],
+                'tool_calls': [],
+                'cached': True,
+                'created': int(time())
+            }])
+            return 'cached'
+
+        chat_messages = self.context.build(
+            [self.main_system_message, self.rag_system_message], chat, message
+        )
         assistant_message = await self._generate_chat_response(
             system_message=self.main_system_message,
             chat_messages=chat_messages,
             tools=self.tools_schema
         )
         tool_calls = assistant_message.tool_calls
+        tool_calls_per_turn.observe(min(len(tool_calls or []), self.max_tool_calls))
 
         if tool_calls:
             chat_messages.append(assistant_message)
-            assistant_message = await self._handle_tool_calls(tool_calls, chat_messages)
+            # نسخه کاتالوگی که برای کش پاسخ خوانده شده دوباره از Redis خوانده نمی‌شود
+            catalog_version = cache_entry['catalog_version'] if cache_entry else None
+            assistant_message = await self._handle_tool_calls(tool_calls, chat_messages, catalog_version)
         
         assistant_db_message = {
             'role': 'assistant',
             'content': assistant_message.content,
             'tool_calls': [
-                {'name': tc.function.name, 'arguments': tc.function.arguments} for tc in tool_calls
+                {'name': tc.function.name, 'arguments': tc.function.arguments} for tc in tool_calls or []
             ],
             'created': int(time())
         }
-        await add_chat_messages(self.rdb, self.chat_id, [user_db_message, assistant_db_message])
+        await add_chat_messages(self.rdb, self.chat_id, [assistant_db_message])
+        for part, tokens in self.context.report.items():
+            context_tokens.observe(tokens, part=part)
+        # شمار توکن‌های همین درخواست به عنوان آخرین رویداد استریم فرستاده می‌شود
+        await self.sse_stream.send_event('usage', json.dumps({'context': self.context.report, **self.usage}))
 
-    async def _handle_conversation_task(self, message):
+        if cache_entry and assistant_message.content:
+            await save_cached_answer(
+                self.rdb, message, assistant_message.content, cache_entry['query_vector'],
+                cache_entry['catalog_version'], settings.ANSWER_CACHE_TTL
+            )
+        return 'ok'
+
+    async def _update_summary(self):
         try:
-            await self._run_conversation_step(message)
+            summary = await self.context.summarize()
+            if summary is not None:
+                await save_chat_summary(self.rdb, self.chat_id, summary)
+        except Exception as e:
+            print(f'Error updating summary of chat {self.chat_id}: {str(e)}')
+
+    async def _handle_conversation_task(self, message, chat):
+        try:
+            with span('chat.turn'):
+                result = await self._run_conversation_step(message, chat)
+            chat_turns.inc(result=result)
+        except asyncio.CancelledError:
+            # کلاینت قطع شده؛ کسی منتظر استریم نیست و بستن آن ممکن است روی صف پر گیر کند
+            print(f'Generation for chat {self.chat_id} cancelled')
+            chat_turns.inc(result='cancelled')
+            self.sse_stream.cancel_timers()
+            raise
         except Exception as e:
             # TODO: Improve error handling (send SSE message to client)
             print(f'Error: {str(e)}')
-        finally:
-            await self.sse_stream.close()
+            chat_turns.inc(result='error')
+        await self.sse_stream.close()
+
+        # خلاصه پس از بسته شدن استریم و بیرون از اسلات تولید پاسخ به‌روز می‌شود تا پاسخ کاربر معطل نماند
+        if self.generations:
+            self.generations.run_in_background(self._update_summary())
+        else:
+            await self._update_summary()
 
-    def run(self, message):
+    def run(self, message, chat):
+        """Stream a reply to message; chat is the state returned by start_chat_turn, which stored the message."""
         self.sse_stream = SSEStream()
-        asyncio.create_task(self._handle_conversation_task(message))
+        coro = self._handle_conversation_task(message, chat)
+        self.task = self.generations.start(coro) if self.generations else asyncio.create_task(coro)
         return self.sse_stream
 
+    def cancel(self):
+        """Stop the generation, closing its OpenAI stream and pending tool calls."""
+        if self.task is not None and not self.task.done():
+            self.task.cancel()
+
 
 
 
@@ -0,0 +1,133 @@
+from app.openai import token_size, truncate_tokens, chat_completion
+from app.assistants.prompts import SUMMARY_SYSTEM_PROMPT, SUMMARY_UPDATE_PROMPT, SUMMARY_CONTEXT_PROMPT
+from app.config import settings
+
+# هر نوبت چت یک پیام کاربر و یک پاسخ دستیار اضافه می‌کند
+MESSAGES_PER_TURN = 2
+
+class ContextBuilder:
+    """Fits the prompt of a chat turn into a token budget.
+
+    History is kept newest first while it fits its share of the budget. Older messages that are no
+    longer sent are folded into the chat's rolling summary once summary_batch_size of them have piled up,
+    or earlier if the oldest would otherwise drop out of the messages fetched for the next turn. Tool
+    results get at least tool_min_size tokens each; history is trimmed from the oldest message to make
+    room for them.
+    """
+
+    def __init__(
+        self,
+        history_size=15,
+        budget=settings.CONTEXT_TOKEN_BUDGET,
+        history_budget=settings.CONTEXT_HISTORY_TOKENS,
+        tool_budget=settings.CONTEXT_TOOL_TOKENS,
+        summary_budget=settings.CONTEXT_SUMMARY_TOKENS,
+        tool_min_size=settings.CONTEXT_TOOL_MIN_TOKENS,
+        summary_batch_size=settings.CONTEXT_SUMMARY_BATCH_MESSAGES
+    ):
+        self.history_size = history_size
+        self.budget = budget
+        self.history_budget = history_budget
+        self.tool_budget = tool_budget
+        self.summary_budget = summary_budget
+        self.tool_min_size = tool_min_size
+        self.summary_batch_size = summary_batch_size
+        self.summary = {'content': '', 'covered': 0}
+        self.pending = []
+        self.covered = 0
+        self.fetch_slack = 0
+        self.history = []
+        self.report = {}
+
+    @property
+    def fetch_size(self):
+        # پیام‌هایی که از پنجره تاریخچه بیرون می‌افتند هم باید خوانده شوند تا وارد خلاصه شوند
+        return self.history_size * 2
+
+    def _update_total(self):
+        self.report.pop('total', None)
+        self.report['total'] = sum(self.report.values())
+
+    def _remaining(self):
+        return max(self.budget - self.report['total'], 0)
+
+    def build(self, system_messages, chat, message):
+        """Return the chat messages of the turn, reserving room for the largest system prompt."""
+        self.summary = chat['summary']
+        self.report = {'system': max(token_size(m['content']) for m in system_messages), 'summary': 0}
+        chat_messages = []
+
+        if self.summary['content']:
+            summary, self.report['summary'] = truncate_tokens(
+                SUMMARY_CONTEXT_PROMPT.format(summary=self.summary['content']), self.summary_budget
+            )
+            chat_messages.append({'role': 'system', 'content': summary})
+        self.report['user'] = token_size(message)
+        self._update_total()
+
+        # پیام‌هایی که قبلاً خلاصه شده‌اند دوباره فرستاده نمی‌شوند
+        start = min(max(self.summary['covered'] - chat['offset'], 0), len(chat['messages']))
+        candidates = chat['messages'][start:]
+        history_budget = min(self.history_budget, self._remaining())
+        history, used = [], 0
+        for m in reversed(candidates[-self.history_size:]):
+            size = token_size(m['content'] or '')
+            if used + size > history_budget:
+                break
+            history.append((m, size))
+            used += size
+        history.reverse()
+        self.history = history
+        self.report['history'] = used
+        self._update_total()
+
+        self.pending = candidates[:len(candidates) - len(history)]
+        self.covered = chat['offset'] + start + len(self.pending)
+        # چند پیام دیگر می‌تواند اضافه شود تا قدیمی‌ترین پیام خلاصه‌نشده از پنجره خوانده‌شده بیرون بیفتد
+        self.fetch_slack = start + self.fetch_size - len(chat['messages'])
+        return [*chat_messages, *(m for m, _ in history), {'role': 'user', 'content': message}]
+
+    def _trim_history(self, chat_messages, needed):
+        """Drop the oldest history messages from chat_messages until `needed` tokens are left."""
+        while self.history and self._remaining() < needed:
+            m, size = self.history.pop(0)
+            chat_messages.remove(m)
+            # پیامی که دیگر فرستاده نمی‌شود باید وارد خلاصه شود
+            self.pending.append(m)
+            self.covered += 1
+            self.report['history'] -= size
+            self._update_total()
+
+    def fit_tool_results(self, results, chat_messages):
+        """Truncate tool results so that together they fit in what is left of the budget, trimming
+        history in chat_messages if that leaves less than tool_min_size tokens per result."""
+        n_results = max(len(results), 1)
+        min_size = min(self.tool_min_size, self.tool_budget // n_results)
+        self._trim_history(chat_messages, min_size * n_results)
+        per_result = max(min(self.tool_budget, self._remaining()) // n_results, min_size)
+        fitted, used = [], 0
+        for result in results:
+            text, size = truncate_tokens(result, per_result)
+            fitted.append(text)
+            used += size
+        self.report['tools'] = used
+        self._update_total()
+        return fitted
+
+    def summary_due(self):
+        if not self.pending:
+            return False
+        return len(self.pending) >= self.summary_batch_size or self.fetch_slack < MESSAGES_PER_TURN
+
+    async def summarize(self):
+        """Fold the messages left out of this turn into the rolling summary, or return None if it can wait."""
+        if not self.summary_due():
+            return None
+        messages = '\n'.join(f"{m['role']}: {m['content']}" for m in self.pending if m['content'])
+        content = await chat_completion([
+            {'role': 'system', 'content': SUMMARY_SYSTEM_PROMPT},
+            {'role': 'user', 'content': SUMMARY_UPDATE_PROMPT.format(
+                summary=self.summary['content'] or '-', messages=messages
+            )}
+        ], max_tokens=self.summary_budget)
+        return {'content': content, 'covered': self.covered}
@@ -3,7 +3,7 @@ from rich.console import Console
 from openai import pydantic_function_tool
 from app.db import get_redis
 from app.openai import chat_stream
-from app.assistants.tools import QueryKnowledgeBaseTool
+from app.assistants.tools import QueryKnowledgeBaseTool, run_knowledge_base_queries
 from app.assistants.prompts import MAIN_SYSTEM_PROMPT, RAG_SYSTEM_PROMPT
 
 class LocalRAGAssistant:
@@ -50,11 +50,14 @@ class LocalRAGAssistant:
 
             if assistant_message.tool_calls:
                 chat_messages.append(assistant_message)
-                for tool_call in assistant_message.tool_calls[:self.max_tool_calls]:
-                    if self.log_tool_calls:
+                tool_calls = assistant_message.tool_calls[:self.max_tool_calls]
+                if self.log_tool_calls:
+                    for tool_call in tool_calls:
                         self.console.print(f'TOOL CALL:\n{tool_call.to_dict()}', style='red', end='\n\n')
-                    kb_tool = tool_call.function.parsed_arguments
-                    kb_result = await kb_tool(self.rdb)
+                kb_results = await run_knowledge_base_queries(
+                    self.rdb, [tool_call.function.parsed_arguments for tool_call in tool_calls]
+                )
+                for tool_call, kb_result in zip(tool_calls, kb_results):
                     if self.log_tool_results:
                         self.console.print(f'TOOL RESULT:\n{kb_result}', style='magenta', end='\n\n')
                     chat_messages.append(
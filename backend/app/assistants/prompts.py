@@ -79,3 +79,24 @@ RAG_SYSTEM_PROMPT = """
 - از ایموجی‌ها استفاده کن، به بودجه و برند اشاره کن، و اگر موجودی پایینه اطلاع بده.
 - در انتهای پاسخ حتماً تعامل کن: «اینا چطور بودن؟ موردی خاص مدنظرت هست؟ 😊»
 """
+
+SUMMARY_SYSTEM_PROMPT = """
+📝 هدف: به‌روزرسانی خلاصه گفتگوی کاربر با چت‌بات فروشگاه.
+- خلاصه فعلی و پیام‌های جدید بهت داده می‌شه؛ خلاصه رو با پیام‌های جدید کامل کن.
+- نیاز کاربر، دسته‌بندی، بودجه، برندها و محصولاتی که دیده یا پسندیده رو نگه دار.
+- خلاصه کوتاه، بدون ایموجی و به زبان گفتگو باشه.
+- فقط متن خلاصه جدید رو برگردون.
+"""
+
+SUMMARY_UPDATE_PROMPT = """
+خلاصه فعلی:
+{summary}
+
+پیام‌های جدید:
+{messages}
+"""
+
+SUMMARY_CONTEXT_PROMPT = """
+🗂️ خلاصه بخش‌های قبلی گفتگو:
+{summary}
+"""
@@ -1,55 +1,125 @@
+import json
+import asyncio
+import hashlib
+from typing import Literal, Optional
 from pydantic import BaseModel, Field
-from app.db import search_vector_db, get_all_vectors
-from app.openai import get_embedding
-import numpy as np
-from numpy.linalg import norm
+from app.openai import get_embedding, get_query_embeddings
+from app.db import search_vector_db, get_catalog_version
+from app.vector_index import get_vector_index
+from app.lexical_index import reciprocal_rank_fusion
+from app.utils.lru_cache import LRUCache
+from app.utils.text import normalize_text
+from app.utils.metrics import timed, tool_calls
+from app.config import settings, PRODUCT_CATEGORIES
+
+KB_RESULT_CACHE_PREFIX = 'kb_result:'
+
+# نتیجه ابزار برای یک کوئری و فیلتر در هر نسخه کاتالوگ ثابت است
+kb_result_cache = LRUCache(settings.KB_RESULT_CACHE_SIZE, ttl=settings.KB_RESULT_CACHE_TTL)
+kb_result_cache_redis_stats = {'hits': 0, 'misses': 0}
 
 class QueryKnowledgeBaseTool(BaseModel):
     """Query and filter knowledge base for product search."""
     query_input: str = Field(description='User search query about motorcycle products')
+    category: Optional[Literal[PRODUCT_CATEGORIES]] = Field(
+        None, description='Only return products from this category, if the user asked for one'
+    )
+    brand: Optional[str] = Field(None, description='Only return products of this brand, if the user asked for one')
+    price_min: Optional[int] = Field(None, description='Minimum price in Toman, if the user gave a budget')
+    price_max: Optional[int] = Field(None, description='Maximum price in Toman, if the user gave a budget')
+    in_stock: Optional[bool] = Field(None, description='Set to true to only return products that are in stock')
+
+    def filters(self):
+        filters = self.model_dump(exclude={'query_input'}, exclude_none=True)
+        # in_stock=False یعنی «مهم نیست»، نه «فقط ناموجودها»، پس فیلتر حساب نمی‌شود
+        if not filters.get('in_stock'):
+            filters.pop('in_stock', None)
+        return filters
+
+    def cache_key(self, catalog_version):
+        params = json.dumps([normalize_text(self.query_input), self.filters()], sort_keys=True, ensure_ascii=False)
+        digest = hashlib.sha1(params.encode()).hexdigest()
+        return f'{KB_RESULT_CACHE_PREFIX}{catalog_version}:{digest}'
 
-    async def __call__(self, rdb):
-        query_vector = await get_embedding(self.query_input)
-        all_chunks = await get_all_vectors(rdb)
-
-        q = self.query_input.lower().strip()
-        query_words = set(q.split())
-
-        # جستجوی تطبیقی قوی‌تر
-        filtered_chunks = []
-        for chunk in all_chunks:
-            meta = chunk.get("metadata", {})
-            text_fields = [
-                chunk.get("text", ""),
-                meta.get("name", ""),
-                meta.get("brand", ""),
-                meta.get("category", ""),
-                meta.get("search_text", "")
-            ]
-            combined = " ".join(text_fields).lower()
-            if any(word in combined for word in query_words):
-                filtered_chunks.append(chunk)
-
-        # fallback اگه خیلی کم بود
-        if len(filtered_chunks) < 3:
-            filtered_chunks = all_chunks
-
-        vectors = [c["vector"] for c in filtered_chunks]
-        texts = [c["text"] for c in filtered_chunks]
-        doc_names = [c["doc_name"] for c in filtered_chunks]
-
-        scores = []
-        for idx, v in enumerate(vectors):
-            try:
-                sim = np.dot(query_vector, v) / (norm(query_vector) * norm(v))
-            except:
-                sim = 0
-            scores.append((sim, idx))
-
-        # top-k نهایی
-        top_k = sorted(scores, reverse=True)[:5]
+    @timed('kb.query')
+    async def __call__(self, rdb, query_vector=None, top_k=5, candidates_k=50, catalog_version=None):
+        if query_vector is None:
+            query_vector = await get_embedding(self.query_input, rdb=rdb)
+        index = await get_vector_index(rdb, catalog_version)
+        filters = self.filters()
+        top_rows = await self._search(rdb, index, query_vector, filters, top_k, candidates_k)
+
+        # نام برندی که مدل می‌دهد ممکن است با نام ثبت‌شده در کاتالوگ یکی نباشد،
+        # پس اگر نتیجه‌ای نبود بدون فیلتر برند دوباره جستجو می‌شود
         results = []
-        for score, idx in top_k:
-            results.append(f"SOURCE: {doc_names[idx]}\n\"\"\"\n{texts[idx]}\n\"\"\"")
+        if not top_rows and 'brand' in filters:
+            filters = {field: value for field, value in filters.items() if field != 'brand'}
+            top_rows = await self._search(rdb, index, query_vector, filters, top_k, candidates_k)
+            if top_rows:
+                results.append(f"⚠️ محصولی از برند «{self.brand}» پیدا نشد؛ نتایج زیر از برندهای دیگر هستند")
+
+        if not top_rows:
+            return '❌ محصولی پیدا نشد'
+
+        for idx in top_rows:
+            results.append(f"SOURCE: {index.doc_names[idx]}\n\"\"\"\n{index.texts[idx]}\n\"\"\"")
 
         return "\n\n---\n\n".join(results) + "\n\n---"
+
+    async def _search(self, rdb, index, query_vector, filters, top_k, candidates_k):
+        """Rank chunks semantically and lexically and fuse the two rankings with RRF."""
+        if filters:
+            # فیلترها در Redis اعمال می‌شوند تا KNN فقط روی زیرمجموعه منطبق اجرا شود
+            matches = await search_vector_db(rdb, query_vector, top_k=candidates_k, filters=filters)
+            vector_rows = [index.rows[m['chunk_id']] for m in matches if m['chunk_id'] in index.rows]
+            lexical_rows = [
+                row for _, row in index.lexical_search(self.query_input, top_k=candidates_k * 4)
+                if index.matches_filters(row, filters)
+            ][:candidates_k]
+        else:
+            vector_rows = [row for _, row in index.search(query_vector, top_k=candidates_k)]
+            lexical_rows = [row for _, row in index.lexical_search(self.query_input, top_k=candidates_k)]
+        return reciprocal_rank_fusion([vector_rows, lexical_rows])[:top_k]
+
+
+def get_kb_result_cache_stats():
+    return {'local': kb_result_cache.stats(), 'redis': dict(kb_result_cache_redis_stats)}
+
+async def run_knowledge_base_queries(rdb, kb_tools, catalog_version=None):
+    """Run several knowledge base lookups concurrently, embedding all their queries in one request.
+
+    Results are cached per catalog version, so repeated lookups skip embedding and scoring entirely.
+    The version is read from Redis unless the turn already has it.
+    """
+    tool_calls.inc(len(kb_tools))
+    if catalog_version is None:
+        catalog_version = await get_catalog_version(rdb)
+    keys = [kb_tool.cache_key(catalog_version) for kb_tool in kb_tools]
+    results = [kb_result_cache.get(key) for key in keys]
+
+    missing = [i for i, result in enumerate(results) if result is None]
+    if missing and settings.KB_RESULT_CACHE_REDIS_TTL:
+        cached = await rdb.mget([keys[i] for i in missing])
+        for i, value in zip(missing, cached):
+            if value is not None:
+                results[i] = value.decode()
+                kb_result_cache.set(keys[i], results[i])
+        kb_result_cache_redis_stats['hits'] += sum(value is not None for value in cached)
+        kb_result_cache_redis_stats['misses'] += sum(value is None for value in cached)
+        missing = [i for i in missing if results[i] is None]
+
+    if missing:
+        query_vectors = await get_query_embeddings([kb_tools[i].query_input for i in missing], rdb=rdb)
+        fresh = await asyncio.gather(*(
+            kb_tools[i](rdb, query_vector=query_vector, catalog_version=catalog_version)
+            for i, query_vector in zip(missing, query_vectors)
+        ))
+        for i, result in zip(missing, fresh):
+            results[i] = result
+            kb_result_cache.set(keys[i], result)
+        if settings.KB_RESULT_CACHE_REDIS_TTL:
+            async with rdb.pipeline(transaction=False) as pipe:
+                for i in missing:
+                    pipe.set(keys[i], results[i], ex=settings.KB_RESULT_CACHE_REDIS_TTL)
+                await pipe.execute()
+    return results
@@ -0,0 +1,47 @@
+import hashlib
+from types import SimpleNamespace
+import numpy as np
+import app.openai
+from app.config import settings
+
+
+def fake_embedding(text, dimensions=settings.EMBEDDING_DIMENSIONS):
+    """Deterministic unit vector derived from the text, so runs are repeatable without an API key."""
+    seed = int.from_bytes(hashlib.sha1(text.encode()).digest()[:8], 'little')
+    vector = np.random.default_rng(seed).normal(size=dimensions).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+def fake_reply(messages):
+    last = messages[-1]['content'] if messages else ''
+    return f'پاسخ آزمایشی به: {last[:80]}'
+
+
+class FakeEmbeddings:
+    async def create(self, input, model=settings.EMBEDDING_MODEL, dimensions=settings.EMBEDDING_DIMENSIONS, **kwargs):
+        texts = [input] if isinstance(input, str) else input
+        return SimpleNamespace(data=[
+            SimpleNamespace(index=i, embedding=fake_embedding(text, dimensions).tolist())
+            for i, text in enumerate(texts)
+        ])
+
+class FakeChatCompletions:
+    async def create(self, messages, model=settings.MODEL, **kwargs):
+        message = SimpleNamespace(role='assistant', content=fake_reply(messages), tool_calls=None)
+        return SimpleNamespace(choices=[SimpleNamespace(index=0, message=message, finish_reason='stop')])
+
+class FakeOpenAIClient:
+    """Stand-in for AsyncOpenAI covering the embeddings and non-streaming chat calls."""
+
+    def __init__(self):
+        self.embeddings = FakeEmbeddings()
+        self.chat = SimpleNamespace(completions=FakeChatCompletions())
+
+
+def install_fake_openai():
+    """Route every call made through app.openai to the fake backend.
+
+    The query embedding batcher's window is also turned off, so sequential timings measure the code
+    path rather than the wait for other requests to join a batch.
+    """
+    app.openai.client = FakeOpenAIClient()
+    app.openai.embedding_batcher.window = 0
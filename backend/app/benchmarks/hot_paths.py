@@ -0,0 +1,216 @@
+import os
+import sys
+import json
+import inspect
+import random
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from datetime import datetime, UTC
+from time import perf_counter
+import numpy as np
+from app.benchmarks.fake_openai import install_fake_openai, fake_embedding
+from app.utils.splitter import TextSplitter
+from app.loader import CatalogSync, iter_json_array, process_docs, build_lexical_index
+from app.db import (
+    VECTOR_IDX_NAME, get_redis, setup_db, bump_catalog_version, search_vector_db
+)
+import app.vector_index
+from app.vector_index import get_vector_index
+from app.assistants.tools import QueryKnowledgeBaseTool
+from app.config import settings
+
+RESULTS_DIR = os.path.join(settings.EXPORT_DIR, 'benchmarks')
+REGRESSION_THRESHOLD = 1.2
+
+
+def synthetic_catalog(items, scale):
+    """Repeat the bundled products `scale` times, making each copy a distinct product."""
+    for copy in range(scale):
+        for n, item in enumerate(items):
+            if copy == 0:
+                yield item
+                continue
+            item = dict(item)
+            item['product_id'] = f"{item.get('product_id') or n}-{copy}"
+            item['title'] = f"{item.get('title', '')} #{copy}"
+            item['url'] = f"{item.get('url', '')}?copy={copy}"
+            yield item
+
+def write_catalog(items, scale, docs_dir):
+    path = os.path.join(docs_dir, 'catalog.json')
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write('[')
+        for n, item in enumerate(synthetic_catalog(items, scale)):
+            file.write((',' if n else '') + json.dumps(item, ensure_ascii=False))
+        file.write(']')
+    return path
+
+def sample_queries(items, n_queries, seed=0):
+    rng = random.Random(seed)
+    titles = [item['title'] for item in items if item.get('title')]
+    return [f'{rng.choice(titles)} {i}' for i in range(n_queries)]
+
+def throughput(name, count, seconds, unit):
+    return {'path': name, 'count': count, 'seconds': seconds, 'per_second': count / seconds if seconds else None, 'unit': unit}
+
+def latency(name, latencies):
+    latencies = np.array(latencies) * 1000
+    p50, p99 = np.percentile(latencies, [50, 99])
+    return {'path': name, 'count': len(latencies), 'p50_ms': float(p50), 'p99_ms': float(p99), 'mean_ms': float(latencies.mean())}
+
+async def timed_queries(queries, run):
+    latencies = []
+    for query in queries:
+        start = perf_counter()
+        result = run(query)
+        if inspect.isawaitable(result):
+            await result
+        latencies.append(perf_counter() - start)
+    return latencies
+
+async def bench_scale(rdb, items, scale, n_queries):
+    results = []
+    with tempfile.TemporaryDirectory() as docs_dir:
+        write_catalog(items, scale, docs_dir)
+
+        start = perf_counter()
+        docs = list(process_docs(docs_dir))
+        results.append(throughput('process_docs', len(docs), perf_counter() - start, 'docs'))
+
+        splitter = TextSplitter(chunk_size=512, chunk_overlap=150)
+        start = perf_counter()
+        chunks = splitter.split_batch([doc['text'] for doc in docs])
+        results.append(throughput('text_splitter', len(docs), perf_counter() - start, 'docs'))
+        del docs, chunks
+
+        await setup_db(rdb)
+        start = perf_counter()
+        sync = CatalogSync(rdb, {}, docs_dir)
+        await sync.run()
+        await build_lexical_index(rdb)
+        await bump_catalog_version(rdb)
+        results.append(throughput('load_catalog', len(sync.new_states), perf_counter() - start, 'products'))
+
+    app.vector_index._index = None
+    start = perf_counter()
+    index = await get_vector_index(rdb)
+    results.append(throughput('vector_index_load', len(index), perf_counter() - start, 'chunks'))
+
+    queries = sample_queries(items, n_queries)
+    vectors = {query: fake_embedding(query) for query in queries}
+    results.append(latency('search_vector_db', await timed_queries(
+        queries, lambda q: search_vector_db(rdb, vectors[q])
+    )))
+    results.append(latency('search_vector_db_filtered', await timed_queries(
+        queries, lambda q: search_vector_db(rdb, vectors[q], filters={'in_stock': True, 'price_max': 10_000_000})
+    )))
+    results.append(latency('vector_index_search', await timed_queries(
+        queries, lambda q: index.search(vectors[q], top_k=50)
+    )))
+    results.append(latency('query_knowledge_base', await timed_queries(
+        queries, lambda q: QueryKnowledgeBaseTool(query_input=q)(rdb)
+    )))
+    results.append(latency('query_knowledge_base_filtered', await timed_queries(
+        queries, lambda q: QueryKnowledgeBaseTool(query_input=q, in_stock=True)(rdb)
+    )))
+    for result in results:
+        result['scale'] = scale
+    return results
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+def metric(result):
+    return ('p99_ms', result['p99_ms']) if 'p99_ms' in result else ('seconds', result['seconds'])
+
+def compare(results, baseline_path):
+    """Print the change of each result against a previous run; slower by REGRESSION_THRESHOLD is flagged."""
+    with open(baseline_path) as file:
+        baseline = {(r['scale'], r['path']): r for r in json.load(file)['results']}
+    print(f'\nCompared with {baseline_path}')
+    regressions = 0
+    for result in results:
+        previous = baseline.get((result['scale'], result['path']))
+        if previous is None:
+            continue
+        name, value = metric(result)
+        ratio = value / metric(previous)[1] if metric(previous)[1] else float('inf')
+        flag = 'REGRESSION' if ratio > REGRESSION_THRESHOLD else ''
+        regressions += bool(flag)
+        print(f"{result['scale']:>4}x {result['path']:<30} {name:<8} {ratio:>6.2f}x {flag}")
+    return regressions
+
+def print_results(results):
+    print(f"\n{'scale':>5} {'path':<30} {'count':>8} {'per s':>10} {'p50 ms':>8} {'p99 ms':>8}")
+    for r in results:
+        per_second = f"{r['per_second']:.0f}" if r.get('per_second') else ''
+        p50 = f"{r['p50_ms']:.2f}" if 'p50_ms' in r else ''
+        p99 = f"{r['p99_ms']:.2f}" if 'p99_ms' in r else ''
+        print(f"{r['scale']:>4}x {r['path']:<30} {r['count']:>8} {per_second:>10} {p50:>8} {p99:>8}")
+
+async def run_benchmark(scales, n_queries, output, baseline, overwrite):
+    install_fake_openai()
+    items = []
+    for filename in sorted(os.listdir(settings.DOCS_DIR)):
+        if filename.endswith('.json'):
+            items.extend(iter_json_array(os.path.join(settings.DOCS_DIR, filename)))
+    print(f'{len(items)} bundled products, scales {scales}, {n_queries} queries per path')
+
+    results = []
+    async with get_redis() as rdb:
+        try:
+            indexed = int((await rdb.ft(VECTOR_IDX_NAME).info())['num_docs'])
+        except Exception:
+            indexed = 0
+        if indexed and not overwrite:
+            print(
+                f'{settings.REDIS_HOST}:{settings.REDIS_PORT} already holds a knowledge base. '
+                'Point REDIS_HOST/REDIS_PORT at a disposable Redis, or pass --overwrite'
+            )
+            return 1
+        for scale in scales:
+            print(f'\nScale {scale}x')
+            results.extend(await bench_scale(rdb, items, scale, n_queries))
+
+    print_results(results)
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w') as file:
+        json.dump({
+            'created': datetime.now(UTC).isoformat(),
+            'commit': git_commit(),
+            'settings': {
+                'vector_storage': settings.VECTOR_STORAGE,
+                'vector_index_algorithm': settings.VECTOR_INDEX_ALGORITHM,
+                'embedding_dimensions': settings.EMBEDDING_DIMENSIONS
+            },
+            'results': results
+        }, file, indent=2)
+    print(f'\nResults written to {output}')
+    if baseline and compare(results, baseline):
+        return 1
+    return 0
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Time the retrieval, splitting and loading hot paths on synthetic catalogs, offline'
+    )
+    parser.add_argument('--scales', default='1,10,100', help='comma separated catalog multipliers')
+    parser.add_argument('--queries', type=int, default=200, help='queries per retrieval path')
+    parser.add_argument('--output', help='results JSON file')
+    parser.add_argument('--baseline', help='results JSON of a previous run to compare against')
+    parser.add_argument('--overwrite', action='store_true', help='allow replacing an existing knowledge base')
+    args = parser.parse_args()
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"hot_paths-{datetime.now(UTC).strftime('%Y%m%dT%H%M%S')}.json"
+    )
+    scales = [int(scale) for scale in args.scales.split(',')]
+    sys.exit(asyncio.run(run_benchmark(scales, args.queries, output, args.baseline, args.overwrite)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,193 @@
+import os
+import json
+import random
+import asyncio
+import argparse
+from collections import Counter
+from datetime import datetime, UTC
+from time import perf_counter
+import httpx
+import numpy as np
+from app.config import settings
+
+RESULTS_DIR = os.path.join(settings.EXPORT_DIR, 'benchmarks')
+
+QUESTIONS = [
+    'یک کلاه کاسکت فک متحرک با قیمت مناسب معرفی کن',
+    'برای سفر طولانی چه باکس موتور سیکلتی پیشنهاد می‌کنی؟',
+    'لاستیک مناسب برای موتور ۲۵۰ سی‌سی چیست؟',
+    'دستکش موتورسواری زمستانی موجود دارید؟',
+    'فرق کاپشن چرمی و کوردورا چیست؟',
+    'زیر ده میلیون تومان چه کاپشنی پیشنهاد می‌کنی؟',
+]
+
+
+class LoadStats:
+    """Results of all sessions, plus the number of reply streams open at once."""
+
+    def __init__(self):
+        self.turns = []
+        self.create_latencies = []
+        self.errors = Counter()
+        self.open_streams = 0
+        self.peak_streams = 0
+
+    def error(self, kind):
+        self.errors[kind] += 1
+
+
+async def run_turn(client, url, chat_id, message, stats):
+    """Send one message and read its SSE reply; TTFB is the time to the first data line."""
+    start = perf_counter()
+    ttfb = None
+    n_chars = 0
+    stats.open_streams += 1
+    stats.peak_streams = max(stats.peak_streams, stats.open_streams)
+    try:
+        async with client.stream('POST', f'{url}/chats/{chat_id}', json={'message': message}) as res:
+            if res.status_code != 200:
+                await res.aread()
+                stats.error(f'http {res.status_code}')
+                return False
+            event = None
+            async for line in res.aiter_lines():
+                if line.startswith('event:'):
+                    event = line[6:].strip()
+                elif not line:
+                    event = None
+                # رویداد usage پایان پاسخ جزو متن نیست
+                elif line.startswith('data:') and event is None:
+                    if ttfb is None:
+                        ttfb = perf_counter() - start
+                    n_chars += len(line) - 5
+    except httpx.HTTPError as e:
+        stats.error(type(e).__name__)
+        return False
+    finally:
+        stats.open_streams -= 1
+
+    if ttfb is None:
+        # خطای سمت سرور فقط لاگ می‌شود و استریم خالی بسته می‌شود
+        stats.error('empty reply')
+        return False
+    stats.turns.append({'ttfb': ttfb, 'total': perf_counter() - start, 'chars': n_chars})
+    return True
+
+async def run_session(client, url, n_turns, think_time, rng, stats):
+    start = perf_counter()
+    try:
+        res = await client.post(f'{url}/chats')
+    except httpx.HTTPError as e:
+        stats.error(f'create {type(e).__name__}')
+        return
+    if res.status_code != 200:
+        stats.error(f'create http {res.status_code}')
+        return
+    stats.create_latencies.append(perf_counter() - start)
+
+    chat_id = res.json()['id']
+    for turn in range(n_turns):
+        if turn and think_time:
+            await asyncio.sleep(rng.expovariate(1 / think_time))
+        if not await run_turn(client, url, chat_id, rng.choice(QUESTIONS), stats):
+            return
+
+def percentiles(values):
+    if not values:
+        return None
+    values = np.array(values) * 1000
+    p50, p90, p99 = np.percentile(values, [50, 90, 99])
+    return {'p50_ms': float(p50), 'p90_ms': float(p90), 'p99_ms': float(p99), 'max_ms': float(values.max())}
+
+def summarize(stats, n_sessions, n_turns, elapsed):
+    n_failed = sum(stats.errors.values())
+    n_attempted = len(stats.turns) + n_failed
+    return {
+        'sessions': n_sessions,
+        'turns_per_session': n_turns,
+        'elapsed_s': elapsed,
+        'turns_ok': len(stats.turns),
+        'turns_failed': n_failed,
+        'error_rate': n_failed / n_attempted if n_attempted else 0.0,
+        'errors': dict(stats.errors),
+        'turns_per_second': len(stats.turns) / elapsed,
+        'chars_per_second': sum(turn['chars'] for turn in stats.turns) / elapsed,
+        'peak_open_streams': stats.peak_streams,
+        'create_chat': percentiles(stats.create_latencies),
+        'ttfb': percentiles([turn['ttfb'] for turn in stats.turns]),
+        'full_response': percentiles([turn['total'] for turn in stats.turns])
+    }
+
+def print_summary(summary):
+    print(
+        f"\n{summary['turns_ok']} turns ok, {summary['turns_failed']} failed "
+        f"({summary['error_rate']:.1%}) in {summary['elapsed_s']:.1f}s"
+    )
+    print(
+        f"{summary['turns_per_second']:.1f} turns/s, {summary['chars_per_second']:.0f} chars/s, "
+        f"peak {summary['peak_open_streams']} open streams"
+    )
+    for kind, count in summary['errors'].items():
+        print(f'  {kind}: {count}')
+    print(f"\n{'':<15} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for name in ('create_chat', 'ttfb', 'full_response'):
+        p = summary[name]
+        if p:
+            print(f"{name:<15} {p['p50_ms']:>9.1f} {p['p90_ms']:>9.1f} {p['p99_ms']:>9.1f} {p['max_ms']:>9.1f}")
+
+async def run_load(url, n_sessions, n_turns, rate, think_time, timeout, seed):
+    """Start n_sessions chat sessions as a Poisson process of `rate` sessions per second."""
+    rng = random.Random(seed)
+    stats = LoadStats()
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    async with httpx.AsyncClient(limits=limits, timeout=httpx.Timeout(timeout, connect=10)) as client:
+        print(
+            f'{n_sessions} sessions x {n_turns} turns against {url}, '
+            f'{rate:g} new sessions/s, {think_time * 1000:g} ms mean think time'
+        )
+        start = perf_counter()
+        tasks = []
+        for _ in range(n_sessions):
+            tasks.append(asyncio.create_task(run_session(client, url, n_turns, think_time, rng, stats)))
+            await asyncio.sleep(rng.expovariate(rate))
+        await asyncio.gather(*tasks)
+        elapsed = perf_counter() - start
+
+        try:
+            server_stats = (await client.get(f'{url}/stats')).json()
+        except (httpx.HTTPError, ValueError):
+            server_stats = None
+    summary = summarize(stats, n_sessions, n_turns, elapsed)
+    summary['server_stats'] = server_stats
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description='Drive concurrent multi-turn chat sessions against a running backend')
+    parser.add_argument('--url', default='http://localhost:8000', help='backend base URL')
+    parser.add_argument('--sessions', type=int, default=200, help='chat sessions to run')
+    parser.add_argument('--turns', type=int, default=3, help='messages per session')
+    parser.add_argument('--rate', type=float, default=10, help='new sessions per second')
+    parser.add_argument('--think-time-ms', type=float, default=1000, help='mean pause between turns of a session')
+    parser.add_argument('--timeout', type=float, default=120, help='seconds to wait for a reply')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='results JSON file')
+    args = parser.parse_args()
+
+    summary = asyncio.run(run_load(
+        args.url.rstrip('/'), args.sessions, args.turns, args.rate, args.think_time_ms / 1000, args.timeout, args.seed
+    ))
+    print_summary(summary)
+
+    output = args.output or os.path.join(RESULTS_DIR, f"load-{datetime.now(UTC).strftime('%Y%m%dT%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w') as file:
+        json.dump({
+            'created': datetime.now(UTC).isoformat(),
+            'args': vars(args),
+            **summary
+        }, file, indent=2, ensure_ascii=False)
+    print(f'\nResults written to {output}')
+
+
+if __name__ == '__main__':
+    main()
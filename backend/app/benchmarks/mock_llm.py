@@ -0,0 +1,164 @@
+import json
+import base64
+import random
+import asyncio
+import argparse
+from time import time
+from uuid import uuid4
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+from app.benchmarks.fake_openai import fake_embedding, fake_reply
+from app.config import settings
+
+
+class MockLLMConfig:
+    """Latency model of the mock server: first token after `latency` seconds, then `token_rate` tokens per second."""
+
+    def __init__(self, latency=0.3, token_rate=50.0, reply_tokens=80, tool_call_ratio=0.5, embedding_latency=0.05):
+        self.latency = latency
+        self.token_rate = token_rate
+        self.reply_tokens = reply_tokens
+        self.tool_call_ratio = tool_call_ratio
+        self.embedding_latency = embedding_latency
+
+
+def reply_tokens(messages, n_tokens):
+    words = fake_reply(messages).split()
+    return [(' ' if i else '') + words[i % len(words)] for i in range(n_tokens)]
+
+def wants_tool_call(body, config):
+    messages = body['messages']
+    return bool(body.get('tools')) and messages[-1]['role'] == 'user' and random.random() < config.tool_call_ratio
+
+def tool_call_arguments(messages):
+    return json.dumps({
+        'query_input': messages[-1]['content'][:200],
+        'category': None, 'brand': None, 'price_min': None, 'price_max': None, 'in_stock': None
+    }, ensure_ascii=False)
+
+def usage(messages, n_completion):
+    # تقریب: هر چهار کاراکتر یک توکن
+    n_prompt = sum(len(str(message.get('content') or '')) for message in messages) // 4
+    return {'prompt_tokens': n_prompt, 'completion_tokens': n_completion, 'total_tokens': n_prompt + n_completion}
+
+def chunk(completion_id, model, delta, finish_reason=None):
+    return {
+        'id': completion_id,
+        'object': 'chat.completion.chunk',
+        'created': int(time()),
+        'model': model,
+        'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}]
+    }
+
+async def stream_completion(body, config):
+    completion_id = f'chatcmpl-{uuid4().hex}'
+    model = body.get('model', settings.MODEL)
+    messages = body['messages']
+
+    def event(data):
+        return f'data: {json.dumps(data, ensure_ascii=False)}\n\n'
+
+    await asyncio.sleep(config.latency)
+    yield event(chunk(completion_id, model, {'role': 'assistant', 'content': ''}))
+    if wants_tool_call(body, config):
+        n_completion = 20
+        tool_call = {
+            'index': 0,
+            'id': f'call_{uuid4().hex[:24]}',
+            'type': 'function',
+            'function': {'name': body['tools'][0]['function']['name'], 'arguments': tool_call_arguments(messages)}
+        }
+        yield event(chunk(completion_id, model, {'tool_calls': [tool_call]}))
+        finish_reason = 'tool_calls'
+    else:
+        tokens = reply_tokens(messages, config.reply_tokens)
+        n_completion = len(tokens)
+        for token in tokens:
+            await asyncio.sleep(1 / config.token_rate)
+            yield event(chunk(completion_id, model, {'content': token}))
+        finish_reason = 'stop'
+    yield event(chunk(completion_id, model, {}, finish_reason))
+    if (body.get('stream_options') or {}).get('include_usage'):
+        usage_chunk = chunk(completion_id, model, {})
+        usage_chunk['choices'] = []
+        usage_chunk['usage'] = usage(messages, n_completion)
+        yield event(usage_chunk)
+    yield 'data: [DONE]\n\n'
+
+def create_app(config):
+    """OpenAI-compatible server for the embeddings and chat completions endpoints the backend calls."""
+    app = FastAPI()
+
+    @app.post('/v1/embeddings')
+    async def embeddings(request: Request):
+        body = await request.json()
+        texts = [body['input']] if isinstance(body['input'], str) else body['input']
+        dimensions = body.get('dimensions') or settings.EMBEDDING_DIMENSIONS
+        await asyncio.sleep(config.embedding_latency)
+        data = []
+        for i, text in enumerate(texts):
+            vector = fake_embedding(text, dimensions)
+            if body.get('encoding_format') == 'base64':
+                embedding = base64.b64encode(vector.astype(np.float32).tobytes()).decode()
+            else:
+                embedding = vector.tolist()
+            data.append({'object': 'embedding', 'index': i, 'embedding': embedding})
+        n_tokens = sum(len(text) for text in texts) // 4
+        return {
+            'object': 'list',
+            'data': data,
+            'model': body.get('model', settings.EMBEDDING_MODEL),
+            'usage': {'prompt_tokens': n_tokens, 'total_tokens': n_tokens}
+        }
+
+    @app.post('/v1/chat/completions')
+    async def chat_completions(request: Request):
+        body = await request.json()
+        if body.get('stream'):
+            return StreamingResponse(stream_completion(body, config), media_type='text/event-stream')
+
+        await asyncio.sleep(config.latency + config.reply_tokens / config.token_rate)
+        tokens = reply_tokens(body['messages'], config.reply_tokens)
+        return {
+            'id': f'chatcmpl-{uuid4().hex}',
+            'object': 'chat.completion',
+            'created': int(time()),
+            'model': body.get('model', settings.MODEL),
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': ''.join(tokens)},
+                'finish_reason': 'stop'
+            }],
+            'usage': usage(body['messages'], len(tokens))
+        }
+
+    return app
+
+def main():
+    parser = argparse.ArgumentParser(description='Mock OpenAI-compatible LLM server for load tests')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8100)
+    parser.add_argument('--latency-ms', type=float, default=300, help='delay before the first token')
+    parser.add_argument('--token-rate', type=float, default=50, help='tokens streamed per second')
+    parser.add_argument('--reply-tokens', type=int, default=80, help='tokens per reply')
+    parser.add_argument(
+        '--tool-call-ratio', type=float, default=0.5,
+        help='share of user turns answered with a knowledge base tool call'
+    )
+    parser.add_argument('--embedding-latency-ms', type=float, default=50)
+    args = parser.parse_args()
+    config = MockLLMConfig(
+        latency=args.latency_ms / 1000,
+        token_rate=args.token_rate,
+        reply_tokens=args.reply_tokens,
+        tool_call_ratio=args.tool_call_ratio,
+        embedding_latency=args.embedding_latency_ms / 1000
+    )
+    print(f'Point the backend at it with OPENAI_BASE_URL=http://{args.host}:{args.port}/v1')
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level='warning')
+
+
+if __name__ == '__main__':
+    main()
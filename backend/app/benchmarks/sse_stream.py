@@ -0,0 +1,84 @@
+import argparse
+import asyncio
+from time import perf_counter
+import numpy as np
+from app.utils.sse_stream import SSEStream
+
+TOKEN = 'کلاه '
+
+
+def parse_config(spec):
+    """raw, or FLUSH_INTERVAL_MS:FLUSH_SIZE"""
+    if spec == 'raw':
+        return {'label': 'raw', 'flush_interval': 0, 'flush_size': 0}
+    interval, size = spec.split(':')
+    return {'label': f'{interval} ms / {size} chars', 'flush_interval': int(interval) / 1000, 'flush_size': int(size)}
+
+async def produce(stream, n_tokens, token_interval):
+    for _ in range(n_tokens):
+        await stream.send(TOKEN)
+        if token_interval:
+            await asyncio.sleep(token_interval)
+    await stream.close()
+
+async def consume(stream, consumer_delay):
+    timestamps = []
+    async for _ in stream:
+        timestamps.append(perf_counter())
+        if consumer_delay:
+            await asyncio.sleep(consumer_delay)
+    return timestamps
+
+async def run_config(config, n_streams, n_tokens, token_interval, consumer_delay, queue_size):
+    streams = [
+        SSEStream(config['flush_interval'], config['flush_size'], max_queue_size=queue_size)
+        for _ in range(n_streams)
+    ]
+    start = perf_counter()
+    results = await asyncio.gather(
+        *(consume(stream, consumer_delay) for stream in streams),
+        *(produce(stream, n_tokens, token_interval) for stream in streams)
+    )
+    elapsed = perf_counter() - start
+    timestamps = results[:n_streams]
+    gaps = np.concatenate([np.diff(ts) for ts in timestamps if len(ts) > 1] or [np.zeros(1)]) * 1000
+    n_events = sum(len(ts) for ts in timestamps)
+    return (config['label'], n_events, n_events / elapsed, *np.percentile(gaps, [50, 99]), elapsed)
+
+async def run_benchmark(configs, n_streams, n_tokens, token_interval, consumer_delay, queue_size):
+    print(
+        f'{n_streams} concurrent streams x {n_tokens} tokens, '
+        f'{token_interval * 1000:g} ms between tokens, {consumer_delay * 1000:g} ms per event on the client'
+    )
+    rows = []
+    for spec in configs:
+        rows.append(await run_config(
+            parse_config(spec), n_streams, n_tokens, token_interval, consumer_delay, queue_size
+        ))
+
+    print(f"\n{'mode':<24} {'events':>9} {'events/s':>11} {'p50 gap ms':>11} {'p99 gap ms':>11} {'wall s':>8}")
+    for label, n_events, rate, p50, p99, elapsed in rows:
+        print(f'{label:<24} {n_events:>9} {rate:>11.0f} {p50:>11.2f} {p99:>11.2f} {elapsed:>8.2f}')
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare raw and coalesced SSE delta streaming')
+    parser.add_argument('--streams', type=int, default=500, help='number of concurrent streams')
+    parser.add_argument('--tokens', type=int, default=300, help='deltas sent per stream')
+    parser.add_argument('--token-interval-ms', type=float, default=1.0, help='delay between deltas')
+    parser.add_argument('--consumer-delay-ms', type=float, default=0.0, help='simulated slow client')
+    parser.add_argument('--queue-size', type=int, default=64)
+    parser.add_argument(
+        '--config', dest='configs', action='append',
+        help='raw or FLUSH_INTERVAL_MS:FLUSH_SIZE (repeatable)'
+    )
+    args = parser.parse_args()
+    configs = args.configs or ['raw', '20:64', '50:256']
+    asyncio.run(run_benchmark(
+        configs, args.streams, args.tokens, args.token_interval_ms / 1000,
+        args.consumer_delay_ms / 1000, args.queue_size
+    ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+import argparse
+import asyncio
+from time import perf_counter
+import numpy as np
+from redis.commands.search.field import TextField
+from redis.commands.search.indexDefinition import IndexDefinition, IndexType
+from redis.commands.search.query import Query
+from app.db import get_redis, vector_field, knn_clause
+from app.config import settings
+
+BENCH_IDX_PREFIX = 'bench:vector:'
+
+
+def synthetic_catalog(size, dim, n_clusters=64, seed=0):
+    """Clustered unit vectors, which resemble product embeddings better than uniform noise."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(n_clusters, dim)).astype(np.float32)
+    vectors = centers[rng.integers(n_clusters, size=size)] + 0.6 * rng.normal(size=(size, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def synthetic_queries(vectors, n_queries, seed=1):
+    rng = np.random.default_rng(seed)
+    queries = vectors[rng.integers(len(vectors), size=n_queries)]
+    queries = queries + 0.3 * rng.normal(size=queries.shape).astype(np.float32)
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+def exact_top_k(vectors, queries, k):
+    scores = queries @ vectors.T
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    return [set(row) for row in top]
+
+def parse_config(spec):
+    """FLAT or HNSW:M:EF_CONSTRUCTION:EF_RUNTIME[,EF_RUNTIME...]"""
+    parts = spec.upper().split(':')
+    if parts[0] == 'FLAT':
+        return {'algorithm': 'FLAT', 'ef_runtimes': [None]}
+    m, ef_construction, ef_runtimes = (parts[1:] + [None] * 3)[:3]
+    return {
+        'algorithm': 'HNSW',
+        'm': int(m or settings.VECTOR_HNSW_M),
+        'ef_construction': int(ef_construction or settings.VECTOR_HNSW_EF_CONSTRUCTION),
+        'ef_runtimes': [int(ef) for ef in (ef_runtimes or str(settings.VECTOR_HNSW_EF_RUNTIME)).split(',')]
+    }
+
+async def build_index(rdb, name, vectors, config, batch_size=1000):
+    prefix = f'{BENCH_IDX_PREFIX}{name}:'
+    schema = (
+        TextField('id', no_stem=True),
+        vector_field(
+            'vector', config['algorithm'], config.get('m'), config.get('ef_construction'), dim=vectors.shape[1]
+        )
+    )
+    await rdb.ft(f'idx:{prefix}').create_index(
+        fields=schema, definition=IndexDefinition(prefix=[prefix], index_type=IndexType.HASH)
+    )
+    start = perf_counter()
+    for offset in range(0, len(vectors), batch_size):
+        async with rdb.pipeline(transaction=False) as pipe:
+            for i in range(offset, min(offset + batch_size, len(vectors))):
+                pipe.hset(f'{prefix}{i}', mapping={'id': i, 'vector': vectors[i].tobytes()})
+            await pipe.execute()
+    while True:
+        info = await rdb.ft(f'idx:{prefix}').info()
+        if float(info.get('percent_indexed', 1)) >= 1:
+            break
+        await asyncio.sleep(0.1)
+    return f'idx:{prefix}', perf_counter() - start
+
+async def run_queries(rdb, index_name, queries, k, algorithm, ef_runtime):
+    latencies = []
+    results = []
+    query = Query(f'(*)=>{knn_clause(k, ef_runtime, algorithm)}').return_fields('id').paging(0, k).dialect(2)
+    for vector in queries:
+        start = perf_counter()
+        res = await rdb.ft(index_name).search(query, {'query_vector': vector.tobytes()})
+        latencies.append(perf_counter() - start)
+        results.append({int(doc.id.rsplit(':', 1)[1]) for doc in res.docs})
+    return results, np.array(latencies) * 1000
+
+async def run_benchmark(size, dim, n_queries, k, configs):
+    print(f'Synthetic catalog: {size} vectors x {dim} dims, {n_queries} queries, k={k}')
+    vectors = synthetic_catalog(size, dim)
+    queries = synthetic_queries(vectors, n_queries)
+    exact = exact_top_k(vectors, queries, k)
+
+    rows = []
+    async with get_redis() as rdb:
+        for n, spec in enumerate(configs):
+            config = parse_config(spec)
+            index_name, build_time = await build_index(rdb, str(n), vectors, config)
+            try:
+                for ef_runtime in config['ef_runtimes']:
+                    results, latencies = await run_queries(
+                        rdb, index_name, queries, k, config['algorithm'], ef_runtime
+                    )
+                    recall = np.mean([len(r & e) / k for r, e in zip(results, exact)])
+                    label = config['algorithm'] if config['algorithm'] == 'FLAT' else (
+                        f"HNSW M={config['m']} EF_C={config['ef_construction']} EF_R={ef_runtime}"
+                    )
+                    rows.append((label, build_time, recall, *np.percentile(latencies, [50, 99])))
+            finally:
+                await rdb.ft(index_name).dropindex(delete_documents=True)
+
+    print(f"\n{'config':<40} {'build s':>8} {'recall@' + str(k):>10} {'p50 ms':>8} {'p99 ms':>8}")
+    for label, build_time, recall, p50, p99 in rows:
+        print(f'{label:<40} {build_time:>8.2f} {recall:>10.3f} {p50:>8.2f} {p99:>8.2f}')
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare FLAT and HNSW vector indexes on a synthetic catalog')
+    parser.add_argument('--size', type=int, default=10_000, help='number of synthetic vectors')
+    parser.add_argument('--dim', type=int, default=settings.EMBEDDING_DIMENSIONS)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--k', type=int, default=settings.VECTOR_SEARCH_TOP_K)
+    parser.add_argument(
+        '--config', dest='configs', action='append',
+        help='FLAT or HNSW:M:EF_CONSTRUCTION:EF_RUNTIME[,EF_RUNTIME...] (repeatable)'
+    )
+    args = parser.parse_args()
+    configs = args.configs or ['FLAT', 'HNSW:16:200:10,50,100', 'HNSW:32:400:50,100,200']
+    asyncio.run(run_benchmark(args.size, args.dim, args.queries, args.k, configs))
+
+
+if __name__ == '__main__':
+    main()
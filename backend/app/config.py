@@ -1,24 +1,69 @@
+from typing import Literal, Optional
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 class Settings(BaseSettings):
     ALLOW_ORIGINS: str = '*'
     OPENAI_API_KEY: str
+    OPENAI_BASE_URL: Optional[str] = None
     MODEL: str = "gpt-4o-mini"
     EMBEDDING_MODEL: str = 'text-embedding-3-large'
     EMBEDDING_DIMENSIONS: int = 1024
     REDIS_HOST: str = 'localhost'
     REDIS_PORT: int = 6379
+    REDIS_MAX_CONNECTIONS: int = 50
+    REDIS_POOL_TIMEOUT: float = 5.0
+    REDIS_SOCKET_TIMEOUT: float = 5.0
+    REDIS_SOCKET_CONNECT_TIMEOUT: float = 2.0
+    REDIS_HEALTH_CHECK_INTERVAL: int = 30
     DOCS_DIR: str = 'data/docs'
     EXPORT_DIR: str = 'data'
     VECTOR_SEARCH_TOP_K: int = 10
     # VECTOR_SEARCH_TOP_K: int = 5
+    VECTOR_STORAGE: Literal['json', 'hash'] = 'json'
+    VECTOR_INDEX_ALGORITHM: Literal['FLAT', 'HNSW'] = 'FLAT'
+    VECTOR_HNSW_M: int = 16
+    VECTOR_HNSW_EF_CONSTRUCTION: int = 200
+    VECTOR_HNSW_EF_RUNTIME: int = 10
+    EMBEDDING_CONCURRENCY: int = 4
+    EMBEDDING_BATCH_SIZE: int = 64
+    EMBEDDING_BATCH_TOKENS: int = 16_000
+    EMBEDDING_MAX_RETRIES: int = 5
+    LOADER_QUEUE_SIZE: int = 16
+    LOADER_WRITE_BATCH_SIZE: int = 256
+    LOADER_SPLIT_BATCH_SIZE: int = 64
+    LOADER_SPLIT_PROCESSES: int = 0
+    EMBEDDING_CACHE_SIZE: int = 10_000
+    EMBEDDING_CACHE_TTL: int = 3600
+    EMBEDDING_CACHE_REDIS_TTL: int = 604800
+    QUERY_EMBEDDING_BATCH_WINDOW_MS: float = 5.0
+    QUERY_EMBEDDING_BATCH_MAX_SIZE: int = 64
+    KB_RESULT_CACHE_SIZE: int = 2000
+    KB_RESULT_CACHE_TTL: int = 600
+    KB_RESULT_CACHE_REDIS_TTL: int = 3600
+    CHAT_HOT_WINDOW: int = 50
+    CONTEXT_TOKEN_BUDGET: int = 8000
+    CONTEXT_HISTORY_TOKENS: int = 2000
+    CONTEXT_TOOL_TOKENS: int = 4000
+    CONTEXT_TOOL_MIN_TOKENS: int = 500
+    CONTEXT_SUMMARY_TOKENS: int = 400
+    CONTEXT_SUMMARY_BATCH_MESSAGES: int = 8
+    ANSWER_CACHE_ENABLED: bool = False
+    ANSWER_CACHE_THRESHOLD: float = 0.95
+    ANSWER_CACHE_TTL: int = 86400
+    SSE_FLUSH_INTERVAL_MS: int = 20
+    SSE_FLUSH_SIZE: int = 64
+    SSE_QUEUE_SIZE: int = 64
+    MAX_CONCURRENT_GENERATIONS: int = 100
+    GENERATION_DRAIN_TIMEOUT: float = 30.0
+    SERVER_TIMING_ENABLED: bool = False
 
     model_config = SettingsConfigDict(env_file='.env')
 
 settings = Settings()
 
-
-
-
-
-
+PRODUCT_CATEGORIES = (
+    'کلاه کاسکت', 'پوشاک موتورسواری', 'لاستیک موتور سیکلت',
+    'لوازم جانبی موتورسیکلت', 'پروتکشن موتور سیکلت', 'باکس موتور سیکلت',
+    'لوازم کلاه کاسکت', 'لوازم کلیک و طرح کلیک', 'لوازم آیروکس و طرح آیروکس (NVX)',
+    'سایر'
+)
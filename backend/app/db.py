@@ -1,60 +1,294 @@
+import re
+import asyncio
 import json
+import hashlib
 import numpy as np
-from time import time
-from redis.asyncio import Redis
-from redis.commands.search.field import TextField, VectorField, NumericField
+from time import time, perf_counter
+from redis.asyncio import Redis, BlockingConnectionPool
+from redis.exceptions import ConnectionError
+from redis.commands.core import AsyncScript
+from redis.commands.search.field import TextField, VectorField, NumericField, TagField
 from redis.commands.search.indexDefinition import IndexDefinition, IndexType
 from redis.commands.search.query import Query
 from redis.commands.json.path import Path
+from app.utils.metrics import timed, chunks_scanned
+from app.utils.text import normalize_brand
 from app.config import settings
 
 VECTOR_IDX_NAME = 'idx:vector'
 VECTOR_IDX_PREFIX = 'vector:'
 CHAT_IDX_NAME = 'idx:chat'
 CHAT_IDX_PREFIX = 'chat:'
+CATALOG_VERSION_KEY = 'catalog:version'
+LEXICAL_INDEX_KEY = 'catalog:lexical'
+PRODUCT_STATES_KEY = 'catalog:products'
+PRODUCT_PREFIX = 'product:'
+CHAT_ARCHIVE_PREFIX = 'chat_archive:'
+ANSWER_IDX_NAME = 'idx:answer'
+ANSWER_IDX_PREFIX = 'answer:'
+CHAT_TTL_SECONDS = 604800
 
+# افزودن پیام‌ها به پنجره داغ چت؛ پیام‌های قدیمی‌تر از پنجره به stream آرشیو منتقل می‌شوند
+APPEND_CHAT_MESSAGES_LUA = """
+local function append_messages(chat_key, archive_key, window, ttl, messages)
+    local length = redis.call('JSON.ARRAPPEND', chat_key, '$.messages', unpack(messages))[1]
+    local overflow = length - window
+    if overflow > 0 then
+        for i = 0, overflow - 1 do
+            local message = redis.call('JSON.GET', chat_key, '$.messages[' .. i .. ']')
+            redis.call('XADD', archive_key, '*', 'message', string.sub(message, 2, -2))
+        end
+        redis.call('JSON.ARRTRIM', chat_key, '$.messages', overflow, length - 1)
+        length = window
+    end
+    local count = redis.call('XLEN', archive_key) + length
+    redis.call('JSON.SET', chat_key, '$.message_count', tostring(count))
+    redis.call('EXPIRE', chat_key, ttl)
+    redis.call('EXPIRE', archive_key, ttl)
+end
+"""
 
-# اتصال به Redis
-def get_redis():
+# KEYS[1]: chat key, KEYS[2]: archive key, ARGV[1]: window, ARGV[2]: ttl, ARGV[3..]: message JSON
+APPEND_CHAT_MESSAGES_SCRIPT = APPEND_CHAT_MESSAGES_LUA + """
+append_messages(KEYS[1], KEYS[2], tonumber(ARGV[1]), ARGV[2], {unpack(ARGV, 3)})
+return true
+"""
+
+# بررسی وجود چت، خواندن خلاصه و تاریخچه و افزودن پیام کاربر در یک رفت‌وبرگشت
+# KEYS[1]: chat key, KEYS[2]: archive key, ARGV[1]: window, ARGV[2]: ttl, ARGV[3]: history path, ARGV[4]: user message JSON
+START_CHAT_TURN_SCRIPT = APPEND_CHAT_MESSAGES_LUA + """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return false
+end
+local history = redis.call('JSON.GET', KEYS[1], '$.summary', '$.message_count', ARGV[3])
+append_messages(KEYS[1], KEYS[2], tonumber(ARGV[1]), ARGV[2], {ARGV[4]})
+return history
+"""
+
+# اسکریپت‌ها یک بار ساخته می‌شوند و با کلاینت هر فراخوانی اجرا می‌شوند (EVALSHA و در صورت نیاز SCRIPT LOAD)
+APPEND_CHAT_MESSAGES = AsyncScript(None, APPEND_CHAT_MESSAGES_SCRIPT.encode())
+START_CHAT_TURN = AsyncScript(None, START_CHAT_TURN_SCRIPT.encode())
+
+
+class InstrumentedConnectionPool(BlockingConnectionPool):
+    """Blocking connection pool that tracks utilization and how long callers wait for a connection."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.acquisitions = 0
+        self.timeouts = 0
+        self.connection_errors = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+
+    async def get_connection(self, *args, **kwargs):
+        start = perf_counter()
+        try:
+            return await super().get_connection(*args, **kwargs)
+        except ConnectionError as e:
+            # فقط تمام شدن مهلت انتظار برای اتصال آزاد timeout حساب می‌شود، نه خطای وصل شدن به Redis
+            if isinstance(e.__cause__, asyncio.TimeoutError):
+                self.timeouts += 1
+            else:
+                self.connection_errors += 1
+            raise
+        finally:
+            wait_time = perf_counter() - start
+            self.acquisitions += 1
+            self.wait_time_total += wait_time
+            self.wait_time_max = max(self.wait_time_max, wait_time)
+
+    def stats(self):
+        in_use = len(self._in_use_connections)
+        return {
+            'max_connections': self.max_connections,
+            'in_use': in_use,
+            'idle': len(self._available_connections),
+            'utilization': in_use / self.max_connections,
+            'acquisitions': self.acquisitions,
+            'timeouts': self.timeouts,
+            'connection_errors': self.connection_errors,
+            'wait_time_avg_ms': 1000 * self.wait_time_total / self.acquisitions if self.acquisitions else 0.0,
+            'wait_time_max_ms': 1000 * self.wait_time_max
+        }
+
+
+def create_redis_pool():
+    return InstrumentedConnectionPool(
+        host=settings.REDIS_HOST,
+        port=settings.REDIS_PORT,
+        max_connections=settings.REDIS_MAX_CONNECTIONS,
+        timeout=settings.REDIS_POOL_TIMEOUT,
+        socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+        socket_connect_timeout=settings.REDIS_SOCKET_CONNECT_TIMEOUT,
+        health_check_interval=settings.REDIS_HEALTH_CHECK_INTERVAL
+    )
+
+# اتصال به Redis؛ API از pool مشترک استفاده می‌کند و اسکریپت‌ها اتصال مستقل خودشان را دارند
+def get_redis(pool=None):
+    if pool is not None:
+        return Redis(connection_pool=pool)
     return Redis(host=settings.REDIS_HOST, port=settings.REDIS_PORT)
 
 
 # ------------------------ VECTORS ------------------------
 
-async def create_vector_index(rdb):
-    schema = (
+def vector_field(path, algorithm=None, m=None, ef_construction=None, dim=None, as_name='vector'):
+    algorithm = algorithm or settings.VECTOR_INDEX_ALGORITHM
+    attributes = {
+        'TYPE': 'FLOAT32',
+        'DIM': dim or settings.EMBEDDING_DIMENSIONS,
+        'DISTANCE_METRIC': 'COSINE'
+    }
+    if algorithm == 'HNSW':
+        attributes['M'] = m or settings.VECTOR_HNSW_M
+        attributes['EF_CONSTRUCTION'] = ef_construction or settings.VECTOR_HNSW_EF_CONSTRUCTION
+    return VectorField(path, algorithm, attributes, as_name=as_name)
+
+def knn_clause(top_k, ef_runtime=None, algorithm=None):
+    algorithm = algorithm or settings.VECTOR_INDEX_ALGORITHM
+    if algorithm == 'HNSW':
+        ef_runtime = ef_runtime or settings.VECTOR_HNSW_EF_RUNTIME
+        return f'[KNN {top_k} @vector $query_vector EF_RUNTIME {ef_runtime} AS score]'
+    return f'[KNN {top_k} @vector $query_vector AS score]'
+
+def vector_schema(storage=None):
+    if (storage or settings.VECTOR_STORAGE) == 'hash':
+        return (
+            TextField('chunk_id', no_stem=True),
+            TextField('text'),
+            TextField('doc_name'),
+            TagField('product_id'),
+            TagField('category'),
+            TagField('brand'),
+            TagField('budget_range'),
+            NumericField('price'),
+            NumericField('in_stock'),
+            vector_field('vector')
+        ), IndexType.HASH
+    return (
         TextField('$.chunk_id', no_stem=True, as_name='chunk_id'),
         TextField('$.text', as_name='text'),
         TextField('$.doc_name', as_name='doc_name'),
-        VectorField(
-            '$.vector',
-            'FLAT',
-            {
-                'TYPE': 'FLOAT32',
-                'DIM': settings.EMBEDDING_DIMENSIONS,
-                'DISTANCE_METRIC': 'COSINE'
-            },
-            as_name='vector'
-        )
-    )
+        TagField('$.metadata.category', as_name='category'),
+        TagField('$.metadata.brand_key', as_name='brand'),
+        TagField('$.metadata.budget_range', as_name='budget_range'),
+        NumericField('$.metadata.price_numeric', as_name='price'),
+        NumericField('$.metadata.in_stock', as_name='in_stock'),
+        vector_field('$.vector')
+    ), IndexType.JSON
+
+async def create_vector_index(rdb, storage=None):
+    schema, index_type = vector_schema(storage)
     try:
         await rdb.ft(VECTOR_IDX_NAME).create_index(
             fields=schema,
-            definition=IndexDefinition(prefix=[VECTOR_IDX_PREFIX], index_type=IndexType.JSON)
+            definition=IndexDefinition(prefix=[VECTOR_IDX_PREFIX], index_type=index_type)
         )
         print(f"Vector index '{VECTOR_IDX_NAME}' created successfully")
     except Exception as e:
         print(f"Error creating vector index '{VECTOR_IDX_NAME}': {e}")
 
-async def add_chunks_to_vector_db(rdb, chunks):
-    async with rdb.pipeline(transaction=True) as pipe:
+# در حالت hash هر چانک یک HASH با بردار باینری FLOAT32 و فیلدهای فیلتر است
+# و متادیتای کامل محصول فقط یک بار در product:{id} ذخیره می‌شود
+def chunk_to_hash(chunk, with_vector=True):
+    meta = chunk['metadata']
+    mapping = {
+        'chunk_id': chunk['chunk_id'],
+        'text': chunk['text'],
+        'doc_name': chunk['doc_name'],
+        'product_id': meta.get('product_id', ''),
+        'category': meta.get('category', ''),
+        'brand': meta.get('brand_key') or normalize_brand(meta.get('brand', '')),
+        'budget_range': meta.get('budget_range', ''),
+        'price': meta.get('price_numeric') or 0,
+        'in_stock': meta.get('in_stock', 0)
+    }
+    if with_vector:
+        mapping['vector'] = np.asarray(chunk['vector'], dtype=np.float32).tobytes()
+    return mapping
+
+def hash_to_chunk(fields, metadata=None):
+    chunk = {
+        key.decode(): value.decode()
+        for key, value in fields.items() if key != b'vector'
+    }
+    chunk['vector'] = np.frombuffer(fields[b'vector'], dtype=np.float32) if b'vector' in fields else None
+    chunk['metadata'] = metadata or {}
+    return chunk
+
+def queue_chunk_writes(pipe, chunks, storage=None, with_vector=True):
+    if (storage or settings.VECTOR_STORAGE) == 'hash':
+        products = {}
+        for chunk in chunks:
+            pipe.hset(VECTOR_IDX_PREFIX + chunk['chunk_id'], mapping=chunk_to_hash(chunk, with_vector))
+            products[chunk['metadata'].get('product_id', '')] = chunk['metadata']
+        for product_id, metadata in products.items():
+            pipe.json().set(PRODUCT_PREFIX + product_id, Path.root_path(), metadata)
+    elif with_vector:
         for chunk in chunks:
             pipe.json().set(VECTOR_IDX_PREFIX + chunk['chunk_id'], Path.root_path(), chunk)
+    else:
+        for chunk in chunks:
+            key = VECTOR_IDX_PREFIX + chunk['chunk_id']
+            pipe.json().set(key, '$.text', chunk['text'])
+            pipe.json().set(key, '$.doc_name', chunk['doc_name'])
+            pipe.json().set(key, '$.metadata', chunk['metadata'])
+
+async def add_chunks_to_vector_db(rdb, chunks, storage=None):
+    async with rdb.pipeline(transaction=False) as pipe:
+        queue_chunk_writes(pipe, chunks, storage)
         await pipe.execute()
 
-async def search_vector_db(rdb, query_vector, top_k=settings.VECTOR_SEARCH_TOP_K):
+async def update_chunks_metadata(rdb, chunks, storage=None):
+    """Refresh text and metadata of existing chunks while keeping their stored vectors."""
+    async with rdb.pipeline(transaction=False) as pipe:
+        queue_chunk_writes(pipe, chunks, storage, with_vector=False)
+        await pipe.execute()
+
+async def delete_chunks(rdb, chunk_ids):
+    if chunk_ids:
+        await rdb.delete(*[VECTOR_IDX_PREFIX + chunk_id for chunk_id in chunk_ids])
+
+async def delete_products(rdb, product_ids):
+    if product_ids:
+        await rdb.delete(*[PRODUCT_PREFIX + product_id for product_id in product_ids])
+
+@timed('redis.get_products_metadata')
+async def get_products_metadata(rdb, product_ids):
+    product_ids = list(product_ids)
+    if not product_ids:
+        return {}
+    res = await rdb.json().mget([PRODUCT_PREFIX + product_id for product_id in product_ids], Path.root_path())
+    return {product_id: metadata or {} for product_id, metadata in zip(product_ids, res)}
+
+def escape_tag(value):
+    return re.sub(r'([^\w])', r'\\\1', str(value).strip())
+
+def build_filter_query(filters=None):
+    """Translate structured product filters into a RediSearch pre-filter expression."""
+    filters = filters or {}
+    clauses = []
+    for field in ('category', 'brand', 'budget_range'):
+        value = filters.get(field)
+        # برند در ایندکس به شکل نرمال‌شده ذخیره می‌شود
+        if value and field == 'brand':
+            value = normalize_brand(value)
+        if value:
+            clauses.append(f'@{field}:{{{escape_tag(value)}}}')
+    price_min, price_max = filters.get('price_min'), filters.get('price_max')
+    if price_min is not None or price_max is not None:
+        low = '-inf' if price_min is None else price_min
+        high = '+inf' if price_max is None else price_max
+        clauses.append(f'@price:[{low} {high}]')
+    if filters.get('in_stock'):
+        clauses.append('@in_stock:[1 1]')
+    return f"({' '.join(clauses)})" if clauses else '(*)'
+
+@timed('redis.search_vector_db')
+async def search_vector_db(rdb, query_vector, top_k=settings.VECTOR_SEARCH_TOP_K, filters=None, ef_runtime=None):
     query = (
-        Query(f'(*)=>[KNN {top_k} @vector $query_vector AS score]')
+        Query(f'{build_filter_query(filters)}=>{knn_clause(top_k, ef_runtime)}')
         .sort_by('score')
         .return_fields('score', 'chunk_id', 'text', 'doc_name')
         .dialect(2)
@@ -62,6 +296,7 @@ async def search_vector_db(rdb, query_vector, top_k=settings.VECTOR_SEARCH_TOP_K
     res = await rdb.ft(VECTOR_IDX_NAME).search(query, {
         'query_vector': np.array(query_vector, dtype=np.float32).tobytes()
     })
+    chunks_scanned.inc(len(res.docs), source='redis')
     return [{
         'score': 1 - float(d.score),
         'chunk_id': d.chunk_id,
@@ -69,10 +304,160 @@ async def search_vector_db(rdb, query_vector, top_k=settings.VECTOR_SEARCH_TOP_K
         'doc_name': d.doc_name
     } for d in res.docs]
 
-async def get_all_vectors(rdb):
-    count = await rdb.ft(VECTOR_IDX_NAME).search(Query('*').paging(0, 0))
-    res = await rdb.ft(VECTOR_IDX_NAME).search(Query('*').paging(0, count.total))
-    return [json.loads(doc.json) for doc in res.docs]
+async def iter_chunk_ids(rdb, page_size=1000):
+    offset = 0
+    while True:
+        res = await rdb.ft(VECTOR_IDX_NAME).search(Query('*').no_content().paging(offset, page_size))
+        yield [doc.id for doc in res.docs]
+        offset += page_size
+        if offset >= res.total:
+            return
+
+@timed('redis.get_all_vectors')
+async def get_all_vectors(rdb, page_size=1000, storage=None):
+    if (storage or settings.VECTOR_STORAGE) == 'json':
+        chunks = []
+        offset = 0
+        while True:
+            res = await rdb.ft(VECTOR_IDX_NAME).search(Query('*').paging(offset, page_size))
+            chunks.extend(json.loads(doc.json) for doc in res.docs)
+            offset += page_size
+            if offset >= res.total:
+                return chunks
+
+    # بردارهای باینری از طریق FT.SEARCH قابل خواندن نیستند، پس مستقیم با HGETALL خوانده می‌شوند
+    chunks = []
+    async for keys in iter_chunk_ids(rdb, page_size):
+        async with rdb.pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.hgetall(key)
+            chunks.extend(hash_to_chunk(fields) for fields in await pipe.execute() if fields)
+    products = await get_products_metadata(rdb, {c['product_id'] for c in chunks})
+    for chunk in chunks:
+        chunk['metadata'] = products.get(chunk['product_id'], {})
+    return chunks
+
+LEXICAL_METADATA_FIELDS = ('name', 'brand', 'category', 'tags')
+
+async def iter_lexical_chunks(rdb, page_size=1000, storage=None):
+    """Yield pages of chunks with only the fields the lexical index reads: chunk_id, text and
+    the name, brand, category and tags of their product."""
+    hash_storage = (storage or settings.VECTOR_STORAGE) == 'hash'
+    if hash_storage:
+        query = Query('*').return_fields('chunk_id', 'text', 'product_id')
+    else:
+        query = (
+            Query('*')
+            .return_field('$.chunk_id', as_field='chunk_id')
+            .return_field('$.text', as_field='text')
+            .return_field('$.metadata', as_field='metadata')
+        )
+    offset = 0
+    while True:
+        res = await rdb.ft(VECTOR_IDX_NAME).search(query.paging(offset, page_size))
+        if hash_storage:
+            product_ids = list({doc.product_id for doc in res.docs})
+            async with rdb.pipeline(transaction=False) as pipe:
+                for product_id in product_ids:
+                    pipe.json().get(PRODUCT_PREFIX + product_id, *(f'$.{field}' for field in LEXICAL_METADATA_FIELDS))
+                products = {
+                    product_id: {field: ((values or {}).get(f'$.{field}') or [''])[0] for field in LEXICAL_METADATA_FIELDS}
+                    for product_id, values in zip(product_ids, await pipe.execute())
+                }
+            yield [
+                {'chunk_id': doc.chunk_id, 'text': doc.text, 'metadata': products.get(doc.product_id, {})}
+                for doc in res.docs
+            ]
+        else:
+            page = []
+            for doc in res.docs:
+                metadata = json.loads(doc.metadata)
+                page.append({
+                    'chunk_id': doc.chunk_id,
+                    'text': doc.text,
+                    'metadata': {field: metadata.get(field) or '' for field in LEXICAL_METADATA_FIELDS}
+                })
+            yield page
+        offset += page_size
+        if offset >= res.total:
+            break
+
+async def get_product_states(rdb):
+    states = await rdb.hgetall(PRODUCT_STATES_KEY)
+    return {product_id.decode(): json.loads(state) for product_id, state in states.items()}
+
+async def save_product_states(rdb, states):
+    if states:
+        await rdb.hset(PRODUCT_STATES_KEY, mapping={
+            product_id: json.dumps(state) for product_id, state in states.items()
+        })
+
+async def delete_product_states(rdb, product_ids):
+    if product_ids:
+        await rdb.hdel(PRODUCT_STATES_KEY, *product_ids)
+
+@timed('redis.get_catalog_version')
+async def get_catalog_version(rdb):
+    version = await rdb.get(CATALOG_VERSION_KEY)
+    return int(version) if version else 0
+
+async def bump_catalog_version(rdb):
+    return await rdb.incr(CATALOG_VERSION_KEY)
+
+async def save_lexical_index(rdb, data):
+    await rdb.set(LEXICAL_INDEX_KEY, data)
+
+@timed('redis.get_lexical_index')
+async def get_lexical_index(rdb):
+    return await rdb.get(LEXICAL_INDEX_KEY)
+
+
+# ------------------------ ANSWER CACHE ------------------------
+
+async def create_answer_index(rdb):
+    try:
+        schema = (
+            TagField('catalog_version'),
+            vector_field('vector', algorithm='FLAT')
+        )
+        await rdb.ft(ANSWER_IDX_NAME).create_index(
+            fields=schema,
+            definition=IndexDefinition(prefix=[ANSWER_IDX_PREFIX], index_type=IndexType.HASH)
+        )
+        print(f"Answer index '{ANSWER_IDX_NAME}' created successfully")
+    except Exception as e:
+        print(f"Error creating answer index '{ANSWER_IDX_NAME}': {e}")
+
+@timed('redis.search_answer_cache')
+async def search_answer_cache(rdb, query_vector, catalog_version):
+    """Return (similarity, answer) for the closest cached answer of this catalog version, or None."""
+    query = (
+        Query(f'@catalog_version:{{{catalog_version}}}=>{knn_clause(1, algorithm="FLAT")}')
+        .sort_by('score')
+        .return_fields('score', 'answer')
+        .dialect(2)
+    )
+    res = await rdb.ft(ANSWER_IDX_NAME).search(query, {
+        'query_vector': np.array(query_vector, dtype=np.float32).tobytes()
+    })
+    if not res.docs:
+        return None
+    return 1 - float(res.docs[0].score), res.docs[0].answer
+
+@timed('redis.save_cached_answer')
+async def save_cached_answer(rdb, question, answer, query_vector, catalog_version, ttl_seconds):
+    digest = hashlib.sha1(question.encode()).hexdigest()
+    key = f'{ANSWER_IDX_PREFIX}{catalog_version}:{digest}'
+    async with rdb.pipeline(transaction=False) as pipe:
+        pipe.hset(key, mapping={
+            'question': question,
+            'answer': answer,
+            'catalog_version': catalog_version,
+            'vector': np.array(query_vector, dtype=np.float32).tobytes(),
+            'created': int(time())
+        })
+        pipe.expire(key, ttl_seconds)
+        await pipe.execute()
 
 
 # ------------------------ CHATS ------------------------
@@ -91,40 +476,132 @@ async def create_chat_index(rdb):
         print(f"Error creating chat index '{CHAT_IDX_NAME}': {e}")
 
 # ✅ نسخه نهایی با تنظیم TTL پیش‌فرض 7 روز (604800 ثانیه)
-async def create_chat(rdb, chat_id, created, ttl_seconds=604800):
-    chat = {'id': chat_id, 'created': created, 'messages': []}
+@timed('redis.create_chat')
+async def create_chat(rdb, chat_id, created, ttl_seconds=CHAT_TTL_SECONDS):
+    chat = {'id': chat_id, 'created': created, 'message_count': 0, 'messages': []}
     key = CHAT_IDX_PREFIX + chat_id
     await rdb.json().set(key, Path.root_path(), chat)
     await rdb.expire(key, ttl_seconds)
     return chat
 
-# ✅ افزودن created در صورت نبود
-async def add_chat_messages(rdb, chat_id, messages):
+def chat_keys(chat_id):
+    return [CHAT_IDX_PREFIX + chat_id, CHAT_ARCHIVE_PREFIX + chat_id]
+
+# ✅ افزودن created در صورت نبود، برش پنجره داغ و تمدید TTL در همان رفت‌وبرگشت
+@timed('redis.add_chat_messages')
+async def add_chat_messages(rdb, chat_id, messages, ttl_seconds=CHAT_TTL_SECONDS):
     timestamped = []
     for msg in messages:
         if 'created' not in msg:
             msg['created'] = int(time())
-        timestamped.append(msg)
-    await rdb.json().arrappend(CHAT_IDX_PREFIX + chat_id, '$.messages', *timestamped)
+        timestamped.append(json.dumps(msg))
+    await APPEND_CHAT_MESSAGES(
+        keys=chat_keys(chat_id),
+        args=[settings.CHAT_HOT_WINDOW, ttl_seconds, *timestamped],
+        client=rdb
+    )
 
-async def chat_exists(rdb, chat_id):
-    return await rdb.exists(CHAT_IDX_PREFIX + chat_id)
+def history_path(last_n=None):
+    return '$.messages[*]' if last_n is None else f'$.messages[-{last_n}:]'
 
-async def get_chat_messages(rdb, chat_id, last_n=None):
-    if last_n is None:
-        messages = await rdb.json().get(CHAT_IDX_PREFIX + chat_id, '$.messages[*]')
-    else:
-        messages = await rdb.json().get(CHAT_IDX_PREFIX + chat_id, f'$.messages[-{last_n}:]')
+def history_messages(messages):
     return [{'role': m['role'], 'content': m['content']} for m in messages] if messages else []
 
-async def get_chat(rdb, chat_id):
-    return await rdb.json().get(chat_id)
+@timed('redis.start_chat_turn')
+async def start_chat_turn(rdb, chat_id, user_message, last_n=None, ttl_seconds=CHAT_TTL_SECONDS):
+    """Append the user message and return the chat state before it, or None if the chat does not exist.
+
+    The state holds the last messages, the absolute index of the first of them (`offset`) and the
+    rolling summary of the older messages.
+    """
+    user_message.setdefault('created', int(time()))
+    path = history_path(last_n)
+    res = await START_CHAT_TURN(
+        keys=chat_keys(chat_id),
+        args=[settings.CHAT_HOT_WINDOW, ttl_seconds, path, json.dumps(user_message)],
+        client=rdb
+    )
+    if res is None:
+        return None
+    res = json.loads(res)
+    messages = history_messages(res[path])
+    message_count = res['$.message_count'][0] if res['$.message_count'] else len(messages)
+    return {
+        'messages': messages,
+        'offset': message_count - len(messages),
+        'summary': res['$.summary'][0] if res['$.summary'] else {'content': '', 'covered': 0}
+    }
+
+@timed('redis.save_chat_summary')
+async def save_chat_summary(rdb, chat_id, summary):
+    await rdb.json().set(CHAT_IDX_PREFIX + chat_id, '$.summary', summary)
+
+# صفحه‌بندی keyset روی فیلد created؛ cursor شامل آخرین created و تعداد چت‌های هم‌زمان با آن است
+def chat_page_query(cursor, page_size, asc=True):
+    created, skip = cursor
+    created_range = f'[{created} +inf]' if asc else f'[-inf {created}]'
+    return Query(f'@created:{created_range}').sort_by('created', asc=asc).paging(skip, page_size)
+
+def next_chat_cursor(cursor, created_values):
+    created, skip = cursor
+    last = created_values[-1]
+    ties = sum(value == last for value in created_values)
+    return (last, skip + ties if last == created else ties)
 
-async def get_all_chats(rdb):
-    q = Query('*').sort_by('created', asc=False)
-    count = await rdb.ft(CHAT_IDX_NAME).search(q.paging(0, 0))
-    res = await rdb.ft(CHAT_IDX_NAME).search(q.paging(0, count.total))
-    return [json.loads(doc.json) for doc in res.docs]
+async def iter_chats(rdb, since=None, page_size=500):
+    """Yield pages of full chat documents in ascending `created` order, starting at `since`.
+
+    Pages are keyed on `created` instead of a growing offset; chats that share the timestamp of the
+    previous page's last chat are skipped by counting them.
+    """
+    cursor = (since if since is not None else '-inf', 0)
+    while True:
+        res = await rdb.ft(CHAT_IDX_NAME).search(chat_page_query(cursor, page_size))
+        chats = [json.loads(doc.json) for doc in res.docs]
+        if chats:
+            yield chats
+        if len(chats) < page_size:
+            return
+        cursor = next_chat_cursor(cursor, [chat['created'] for chat in chats])
+
+@timed('redis.list_chats')
+async def list_chats(rdb, cursor=None, page_size=20, preview_size=120):
+    """Return a page of chat summaries, newest first, and the cursor of the next page (None at the end).
+
+    Only the summary fields are returned by RediSearch, so a page never loads whole conversations.
+    """
+    cursor = cursor or ('+inf', 0)
+    query = (
+        chat_page_query(cursor, page_size, asc=False)
+        .return_field('$.id', as_field='chat_id')
+        .return_field('$.created', as_field='created')
+        .return_field('$.message_count', as_field='message_count')
+        .return_field('$.messages[-1].content', as_field='last_message')
+    )
+    res = await rdb.ft(CHAT_IDX_NAME).search(query)
+    chats = []
+    for doc in res.docs:
+        message_count = getattr(doc, 'message_count', None)
+        last_message = getattr(doc, 'last_message', None)
+        chats.append({
+            'id': doc.chat_id,
+            'created': int(doc.created),
+            'message_count': int(message_count) if message_count is not None else None,
+            'last_message': last_message[:preview_size] if last_message else None
+        })
+    next_cursor = None
+    if len(chats) == page_size:
+        next_cursor = next_chat_cursor(cursor, [chat['created'] for chat in chats])
+    return chats, next_cursor
+
+@timed('redis.get_chat_archives')
+async def get_chat_archives(rdb, chat_ids):
+    """Return the archived messages of each chat, oldest first."""
+    async with rdb.pipeline(transaction=False) as pipe:
+        for chat_id in chat_ids:
+            pipe.xrange(CHAT_ARCHIVE_PREFIX + chat_id)
+        archives = await pipe.execute()
+    return [[json.loads(fields[b'message']) for _, fields in entries] for entries in archives]
 
 
 # ------------------------ GENERAL ------------------------
@@ -136,6 +613,9 @@ async def setup_db(rdb):
     except Exception:
         pass
     finally:
+        await rdb.delete(PRODUCT_STATES_KEY, LEXICAL_INDEX_KEY)
+        async for key in rdb.scan_iter(match=PRODUCT_PREFIX + '*', count=1000):
+            await rdb.delete(key)
         await create_vector_index(rdb)
 
     try:
@@ -143,10 +623,41 @@ async def setup_db(rdb):
     except Exception:
         await create_chat_index(rdb)
 
+    # پاسخ‌های کش‌شده به نسخه کاتالوگ وابسته‌اند و با بارگذاری کامل دور ریخته می‌شوند
+    try:
+        await rdb.ft(ANSWER_IDX_NAME).dropindex(delete_documents=True)
+    except Exception:
+        pass
+    await create_answer_index(rdb)
+
+async def ensure_db(rdb):
+    """Create missing indexes without touching existing documents."""
+    try:
+        await rdb.ft(VECTOR_IDX_NAME).info()
+    except Exception:
+        # بدون ایندکس، وضعیت ذخیره‌شده محصولات قابل اعتماد نیست
+        await rdb.delete(PRODUCT_STATES_KEY)
+        await create_vector_index(rdb)
+
+    try:
+        await rdb.ft(CHAT_IDX_NAME).info()
+    except Exception:
+        await create_chat_index(rdb)
+
+    await ensure_answer_index(rdb)
+
+async def ensure_answer_index(rdb):
+    try:
+        await rdb.ft(ANSWER_IDX_NAME).info()
+    except Exception:
+        await create_answer_index(rdb)
+
 async def clear_db(rdb):
-    for index_name in [VECTOR_IDX_NAME, CHAT_IDX_NAME]:
+    for index_name in [VECTOR_IDX_NAME, CHAT_IDX_NAME, ANSWER_IDX_NAME]:
         try:
             await rdb.ft(index_name).dropindex(delete_documents=True)
             print(f"Deleted index '{index_name}' and all associated documents")
         except Exception as e:
             print(f"Index '{index_name}': {e}")
+    async for key in rdb.scan_iter(match=CHAT_ARCHIVE_PREFIX + '*', count=1000):
+        await rdb.delete(key)
@@ -1,27 +1,56 @@
 import os
+import gzip
 import json
 import asyncio
+import argparse
 from datetime import datetime, UTC
-from app.db import get_redis, get_all_chats
+from app.db import get_redis, iter_chats, get_chat_archives
 from app.config import settings
 
-async def export_chats(export_dir=settings.EXPORT_DIR, iso_format=True):
-    print('Exporting chats to JSON')
-    file_path = os.path.join(export_dir, 'chats.json')
+def parse_since(value):
+    """Unix timestamp or ISO date/datetime (UTC unless it has an offset)."""
+    try:
+        return int(value)
+    except ValueError:
+        since = datetime.fromisoformat(value)
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=UTC)
+        return int(since.timestamp())
+
+async def export_chats(export_dir=settings.EXPORT_DIR, iso_format=True, since=None, compress=False, page_size=500):
+    """Stream chats created at or after `since` to an NDJSON file, one page of chats at a time."""
+    file_name = 'chats.ndjson' if since is None else f'chats-since-{since}.ndjson'
+    if compress:
+        file_name += '.gz'
+    file_path = os.path.join(export_dir, file_name)
+    print(f'Exporting chats to {file_path}')
+
+    n_chats = 0
+    open_file = gzip.open if compress else open
     async with get_redis() as rdb:
-        chats = await get_all_chats(rdb)
-        if iso_format:
-            for chat in chats:
-                chat['created'] = datetime.fromtimestamp(chat['created'], tz=UTC).isoformat()
-                for message in chat['messages']:
-                    message['created'] = datetime.fromtimestamp(message['created'], tz=UTC).isoformat()
-        with open(file_path, 'w') as file:
-            json.dump(chats, file, indent=2)
-    print(f'{len(chats)} chats exported')
+        with open_file(file_path, 'wt', encoding='utf-8') as file:
+            async for chats in iter_chats(rdb, since=since, page_size=page_size):
+                # پیام‌های قدیمی‌تر از پنجره داغ در آرشیو چت هستند
+                archives = await get_chat_archives(rdb, [chat['id'] for chat in chats])
+                for chat, archived in zip(chats, archives):
+                    chat['messages'] = archived + chat['messages']
+                    if iso_format:
+                        chat['created'] = datetime.fromtimestamp(chat['created'], tz=UTC).isoformat()
+                        for message in chat['messages']:
+                            message['created'] = datetime.fromtimestamp(message['created'], tz=UTC).isoformat()
+                    file.write(json.dumps(chat, ensure_ascii=False) + '\n')
+                n_chats += len(chats)
+    print(f'{n_chats} chats exported')
 
 def main():
-    asyncio.run(export_chats())
+    parser = argparse.ArgumentParser(description='Export chats to NDJSON')
+    parser.add_argument('--since', type=parse_since, help='only chats created at or after this unix timestamp or ISO date')
+    parser.add_argument('--gzip', action='store_true', help='compress the export with gzip')
+    parser.add_argument('--page-size', type=int, default=500, help='chats fetched from Redis per query')
+    parser.add_argument('--export-dir', default=settings.EXPORT_DIR)
+    args = parser.parse_args()
+    asyncio.run(export_chats(args.export_dir, since=args.since, compress=args.gzip, page_size=args.page_size))
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
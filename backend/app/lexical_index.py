@@ -0,0 +1,117 @@
+import json
+import zlib
+from collections import defaultdict
+import numpy as np
+from app.utils.text import tokenize
+
+# وزن هر فیلد در محاسبه فراوانی ترم (BM25F ساده)
+FIELD_WEIGHTS = {'text': 1.0, 'name': 3.0, 'brand': 2.0, 'category': 2.0, 'tags': 1.5}
+
+
+def chunk_fields(chunk):
+    meta = chunk.get('metadata', {})
+    return {
+        'text': chunk.get('text', ''),
+        'name': meta.get('name', ''),
+        'brand': meta.get('brand', ''),
+        'category': meta.get('category', ''),
+        'tags': ' '.join(meta.get('tags', []))
+    }
+
+
+class LexicalIndex:
+    """BM25 inverted index over chunk text, name, brand, category and tags."""
+
+    def __init__(self, chunk_ids, doc_lengths, postings, k1=1.2, b=0.75):
+        self.chunk_ids = chunk_ids
+        self.k1 = k1
+        self.b = b
+        self.doc_lengths = np.asarray(doc_lengths, dtype=np.float32)
+        avg_length = float(self.doc_lengths.mean()) if len(self.doc_lengths) else 1.0
+        # مخرج BM25 به جز tf برای هر سند از قبل محاسبه می‌شود
+        self.length_norms = k1 * (1 - b + b * self.doc_lengths / (avg_length or 1.0))
+        n_docs = len(chunk_ids)
+        self.postings = {}
+        for term, (docs, tfs) in postings.items():
+            idf = np.log(1 + (n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+            self.postings[term] = (
+                np.asarray(docs, dtype=np.int32),
+                np.asarray(tfs, dtype=np.float32),
+                np.float32(idf)
+            )
+        self._raw_postings = postings
+
+    def __len__(self):
+        return len(self.chunk_ids)
+
+    @classmethod
+    def build(cls, chunks, **kwargs):
+        builder = LexicalIndexBuilder()
+        for chunk in chunks:
+            builder.add(chunk)
+        return builder.build(**kwargs)
+
+    def to_bytes(self):
+        data = {
+            'chunk_ids': self.chunk_ids,
+            'doc_lengths': [round(float(n), 2) for n in self.doc_lengths],
+            'postings': self._raw_postings,
+            'k1': self.k1,
+            'b': self.b
+        }
+        return zlib.compress(json.dumps(data, ensure_ascii=False).encode())
+
+    @classmethod
+    def from_bytes(cls, blob):
+        data = json.loads(zlib.decompress(blob))
+        return cls(data['chunk_ids'], data['doc_lengths'], data['postings'], k1=data['k1'], b=data['b'])
+
+    def search(self, query, top_k):
+        """Return (score, chunk_id) pairs for the best BM25 matches, touching only the query postings."""
+        matched = [self.postings[t] for t in set(tokenize(query)) if t in self.postings]
+        if not matched:
+            return []
+        docs = np.concatenate([docs for docs, _, _ in matched])
+        contributions = np.concatenate([
+            idf * tfs * (self.k1 + 1) / (tfs + self.length_norms[docs])
+            for docs, tfs, idf in matched
+        ])
+        unique_docs, inverse = np.unique(docs, return_inverse=True)
+        scores = np.bincount(inverse, weights=contributions)
+        k = min(top_k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(float(scores[i]), self.chunk_ids[unique_docs[i]]) for i in top]
+
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """Merge several best-first rankings of ids into one, scoring each id by sum(1 / (k + rank))."""
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] += 1 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+class LexicalIndexBuilder:
+    """Collects postings one chunk at a time, so the chunks themselves need not be kept in memory."""
+
+    def __init__(self):
+        self.chunk_ids = []
+        self.doc_lengths = []
+        self.postings = defaultdict(lambda: ([], []))
+
+    def add(self, chunk):
+        doc_idx = len(self.chunk_ids)
+        term_freqs = defaultdict(float)
+        for field, value in chunk_fields(chunk).items():
+            for token in tokenize(value):
+                term_freqs[token] += FIELD_WEIGHTS[field]
+        for term, tf in term_freqs.items():
+            self.postings[term][0].append(doc_idx)
+            self.postings[term][1].append(round(tf, 2))
+        self.chunk_ids.append(chunk['chunk_id'])
+        self.doc_lengths.append(sum(term_freqs.values()))
+
+    def build(self, **kwargs):
+        return LexicalIndex(self.chunk_ids, self.doc_lengths, dict(self.postings), **kwargs)
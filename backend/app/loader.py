@@ -1,24 +1,73 @@
+import argparse
+import hashlib
 import json
 import os
+import random
 import asyncio
-from uuid import uuid4
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
 from tqdm import tqdm
+from openai import APIConnectionError, APIStatusError, APITimeoutError
 from app.utils.splitter import TextSplitter
-from app.openai import get_embeddings, token_size
-from app.db import get_redis, setup_db, add_chunks_to_vector_db
-from app.config import settings
+from app.openai import get_embeddings
+from app.db import (
+    get_redis, setup_db, ensure_db, add_chunks_to_vector_db, update_chunks_metadata,
+    delete_chunks, delete_products, iter_lexical_chunks, save_lexical_index, bump_catalog_version,
+    get_product_states, save_product_states, delete_product_states
+)
+from app.lexical_index import LexicalIndexBuilder
+from app.utils.text import normalize_brand
+from app.config import settings, PRODUCT_CATEGORIES
 
-def batchify(iterable, batch_size):
-    for i in range(0, len(iterable), batch_size):
-        yield iterable[i:i + batch_size]
+FAILED_CHUNKS_FILE = os.path.join(settings.EXPORT_DIR, 'failed_chunks.jsonl')
 
-def load_json_file(path):
-    try:
-        with open(path, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception as e:
-        print(f"Error loading JSON file {path}: {e}")
-        return []
+
+class StageStats:
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.started = None
+        self.finished = None
+
+    def add(self, n=1):
+        now = perf_counter()
+        if self.started is None:
+            self.started = now
+        self.items += n
+        self.finished = now
+
+    def __str__(self):
+        elapsed = (self.finished - self.started) if self.started is not None else 0
+        rate = self.items / elapsed if elapsed else 0
+        return f'{self.name:<8} {self.items:>8} items {elapsed:>8.2f} s {rate:>10.1f} items/s'
+
+
+def iter_json_array(path, read_size=1 << 16):
+    """Yield the items of a top-level JSON array one by one without loading the whole file."""
+    decoder = json.JSONDecoder()
+    with open(path, 'r', encoding='utf-8') as f:
+        buffer = f.read(read_size).lstrip()
+        if not buffer.startswith('['):
+            raise ValueError('expected a JSON array')
+        buffer = buffer[1:]
+        eof = False
+        while True:
+            buffer = buffer.lstrip().removeprefix(',').lstrip()
+            if buffer.startswith(']'):
+                return
+            try:
+                item, end = decoder.raw_decode(buffer)
+                if end == len(buffer) and not eof:
+                    raise json.JSONDecodeError('item may continue', buffer, end)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                data = f.read(read_size)
+                eof = not data
+                buffer += data
+                continue
+            yield item
+            buffer = buffer[end:]
 
 def normalize_budget_range(price_numeric):
     """نرمال‌سازی budget_range برای جستجوی بهتر"""
@@ -37,149 +86,389 @@ def normalize_budget_range(price_numeric):
     else:
         return "over_20m"
 
-async def process_docs(docs_dir=settings.DOCS_DIR):
-    docs = []
-    print('\nLoading documents')
+def is_in_stock(stock):
+    """موجودی متنی مثل «موجود در انبار» یا «۳ عدد در انبار» را به ۰/۱ تبدیل می‌کند"""
+    return int('در انبار' in stock and 'ناموجود' not in stock)
+
+def content_hash(*parts):
+    return hashlib.sha1(json.dumps(parts, ensure_ascii=False, sort_keys=True).encode()).hexdigest()
+
+def build_product_doc(item):
+    attributes = {attr["label"]: attr["value"] for attr in item.get("attributes", [])}
+    features = {feat["label"]: feat["value"] for feat in item.get("features", [])}
+    variations = item.get("variations", [])
+    category = item.get("category", "نامشخص")
+
+    strict_category = category if category in PRODUCT_CATEGORIES else "نامشخص"
+
+    budget_range = normalize_budget_range(item.get('price_numeric'))
+    price_numeric = item.get('price_numeric') or 0
+    product_id = item.get('product_id') or content_hash(item.get('title'), item.get('url'))[:32]
+
+    metadata = {
+        'name': item.get('title', 'محصول ناشناس'),
+        'price': item.get('price', 'نامشخص'),
+        'price_numeric': price_numeric,
+        'budget_range': budget_range,
+        'brand': item.get('brand', 'نامشخص'),
+        'brand_key': normalize_brand(item.get('brand', 'نامشخص')),
+        'category': strict_category,
+        'link': item.get('url', ''),
+        'stock': item.get('stock', 'نامشخص'),
+        'in_stock': is_in_stock(item.get('stock', '')),
+        'attributes': attributes,
+        'features': features,
+        'tags': item.get('tags', []),
+        'variations': variations,
+        'product_id': product_id,
+        'image': item.get('image', ''),
+        'description': item.get('description', '')
+    }
 
+    # بخش‌هایی که فقط قیمت/موجودی را نشان می‌دهند در stable_parts نمی‌آیند،
+    # تا تغییر قیمت یا موجودی باعث embedding دوباره نشود
+    text_parts = []
+    stable_parts = []
+    if 'title' in item:
+        text_parts.append(f"نام محصول: {item['title']}")
+    if 'price' in item:
+        text_parts.append(f"قیمت: {item['price']}")
+    if 'brand' in item:
+        text_parts.append(f"برند: {item['brand']}")
+    if strict_category != "نامشخص":
+        text_parts.append(f"دسته‌بندی: {strict_category}")
+    if features:
+        text_parts.append("ویژگی‌ها:")
+        for key, value in features.items():
+            text_parts.append(f"  - {key}: {value}")
+    if variations:
+        text_parts.append("سایزها و موجودی:")
+        for var in variations:
+            text_parts.append(f"  - سایز: {var.get('size', 'نامشخص')}، موجودی: {var.get('stock', 'نامشخص')}")
+            stable_parts.append(var.get('size', 'نامشخص'))
+    if 'description' in item and item['description']:
+        text_parts.append(f"توضیحات: {item['description']}")
+    if 'tags' in item and item['tags']:
+        text_parts.append(f"تگ‌ها: {', '.join(item['tags'])}")
+    if 'url' in item:
+        text_parts.append(f"لینک محصول: {item['url']}")
+    if 'image' in item:
+        text_parts.append(f"تصویر: {item['image']}")
+
+    volatile = ('قیمت: ', '  - سایز: ')
+    stable_parts.extend(p for p in text_parts if not p.startswith(volatile))
+    text_block = "\n".join(text_parts)
+    return {
+        'product_id': product_id,
+        'doc_name': item.get('title', 'محصول'),
+        'text': text_block,
+        'metadata': metadata,
+        'content_hash': content_hash(text_block, metadata),
+        'embed_hash': content_hash(stable_parts)
+    }
+
+def process_docs(docs_dir=settings.DOCS_DIR, errors=None):
+    """Yield product documents from every JSON file in docs_dir; files that fail to parse are appended to `errors`."""
     files = [f for f in os.listdir(docs_dir) if f.endswith('.json')]
     if not files:
         print(f"No JSON files found in {docs_dir}")
-        return []
 
-    for filename in tqdm(files, desc="Processing files"):
+    for filename in files:
         file_path = os.path.join(docs_dir, filename)
-        doc_name = os.path.splitext(filename)[0]
-
-        data = load_json_file(file_path)
-        if not data or not isinstance(data, list):
-            print(f"Invalid or empty JSON structure in {filename}")
-            continue
-
-        for item in data:
-            attributes = {attr["label"]: attr["value"] for attr in item.get("attributes", [])}
-            features = {feat["label"]: feat["value"] for feat in item.get("features", [])}
-            variations = item.get("variations", [])
-            category = item.get("category", "نامشخص")
-
-            strict_category = category if category in [
-                "کلاه کاسکت", "پوشاک موتورسواری", "لاستیک موتور سیکلت",
-                "لوازم جانبی موتورسیکلت", "پروتکشن موتور سیکلت", "باکس موتور سیکلت",
-                "لوازم کلاه کاسکت", "لوازم کلیک و طرح کلیک", "لوازم آیروکس و طرح آیروکس (NVX)",
-                "سایر"
-            ] else "نامشخص"
-
-            price_numeric = item.get('price_numeric', 0)
-            budget_range = normalize_budget_range(price_numeric)
-
-            metadata = {
-                'name': item.get('title', 'محصول ناشناس'),
-                'price': item.get('price', 'نامشخص'),
-                'price_numeric': price_numeric,
-                'budget_range': budget_range,
-                'brand': item.get('brand', 'نامشخص'),
-                'category': strict_category,
-                'link': item.get('url', ''),
-                'stock': item.get('stock', 'نامشخص'),
-                'attributes': attributes,
-                'features': features,
-                'tags': item.get('tags', []),
-                'variations': variations,
-                'product_id': item.get('product_id', ''),
-                'image': item.get('image', ''),
-                'description': item.get('description', '')
-            }
-
-            text_parts = []
-            if 'title' in item:
-                text_parts.append(f"نام محصول: {item['title']}")
-            if 'price' in item:
-                text_parts.append(f"قیمت: {item['price']}")
-            if 'brand' in item:
-                text_parts.append(f"برند: {item['brand']}")
-            if strict_category != "نامشخص":
-                text_parts.append(f"دسته‌بندی: {strict_category}")
-            if features:
-                text_parts.append("ویژگی‌ها:")
-                for key, value in features.items():
-                    text_parts.append(f"  - {key}: {value}")
-            if variations:
-                text_parts.append("سایزها و موجودی:")
-                for var in variations:
-                    text_parts.append(f"  - سایز: {var.get('size', 'نامشخص')}، موجودی: {var.get('stock', 'نامشخص')}")
-            if 'description' in item and item['description']:
-                text_parts.append(f"توضیحات: {item['description']}")
-            if 'tags' in item and item['tags']:
-                text_parts.append(f"تگ‌ها: {', '.join(item['tags'])}")
-            if 'url' in item:
-                text_parts.append(f"لینک محصول: {item['url']}")
-            if 'image' in item:
-                text_parts.append(f"تصویر: {item['image']}")
-
-            text_block = "\n".join(text_parts)
-            docs.append((item.get('title', 'محصول'), text_block, metadata))
-
-    print(f'Loaded {len(docs)} documents')
-
-    if not docs:
-        print("No valid documents to process")
-        return []
-
-    chunks = []
-    text_splitter = TextSplitter(chunk_size=512, chunk_overlap=150)
-    print('\nSplitting documents into chunks')
-
-    for doc_name, doc_text, metadata in tqdm(docs, desc="Splitting documents"):
-        doc_id = str(uuid4())[:8]
-        doc_chunks = text_splitter.split(doc_text)
-        for chunk_idx, chunk_text in enumerate(doc_chunks):
-            chunk = {
-                'chunk_id': f'{doc_id}:{chunk_idx+1:04}',
-                'text': chunk_text,
-                'doc_name': doc_name,
-                'vector': None,
-                'metadata': metadata
-            }
-            chunks.append(chunk)
-        print(f'{doc_name}: {len(doc_chunks)} chunks')
-
-    chunk_sizes = [token_size(c['text']) for c in chunks]
-    print(f'\nTotal chunks: {len(chunks)}')
-    print(f'Min chunk size: {min(chunk_sizes)} tokens')
-    print(f'Max chunk size: {max(chunk_sizes)} tokens')
-    print(f'Average chunk size: {round(sum(chunk_sizes)/len(chunks))} tokens')
-
-    vectors = []
-    print('\nEmbedding chunks')
-    with tqdm(total=len(chunks), desc="Embedding chunks") as pbar:
-        for batch in batchify(chunks, batch_size=64):
+        try:
+            for item in iter_json_array(file_path):
+                yield build_product_doc(item)
+        except Exception as e:
+            print(f"Error loading JSON file {file_path}: {e}")
+            if errors is not None:
+                errors.append((file_path, e))
+
+def doc_chunks(doc, split_chunks):
+    """Build chunk records from the (text, token_size) pairs returned by the splitter."""
+    return [({
+        'chunk_id': f"{doc['product_id']}:{chunk_idx+1:04}",
+        'text': chunk_text,
+        'doc_name': doc['doc_name'],
+        'vector': None,
+        'metadata': doc['metadata']
+    }, size) for chunk_idx, (chunk_text, size) in enumerate(split_chunks)]
+
+def chunk_ids(product_id, n_chunks):
+    return [f'{product_id}:{chunk_idx+1:04}' for chunk_idx in range(n_chunks)]
+
+def product_state(doc, n_chunks):
+    return {'content_hash': doc['content_hash'], 'embed_hash': doc['embed_hash'], 'chunks': n_chunks}
+
+def is_retryable(error):
+    if isinstance(error, (APIConnectionError, APITimeoutError)):
+        return True
+    return isinstance(error, APIStatusError) and (error.status_code == 429 or error.status_code >= 500)
+
+def retry_delay(error, attempt):
+    # اگر سرور Retry-After فرستاده باشد همان را رعایت می‌کنیم، وگرنه backoff نمایی با jitter
+    retry_after = getattr(getattr(error, 'response', None), 'headers', {}).get('retry-after')
+    try:
+        return float(retry_after)
+    except (TypeError, ValueError):
+        return min(60, 2 ** attempt) * (0.5 + random.random())
+
+async def embed_with_retry(texts, max_retries=settings.EMBEDDING_MAX_RETRIES):
+    for attempt in range(max_retries + 1):
+        try:
+            # تلاش مجدد داخلی کلاینت خاموش است تا تعداد تلاش‌ها فقط با همین حلقه تعیین شود
+            return await get_embeddings(texts, max_retries=0)
+        except Exception as e:
+            if attempt == max_retries or not is_retryable(e):
+                raise
+            await asyncio.sleep(retry_delay(e, attempt))
+
+
+class CatalogSync:
+    """Streaming catalog load: parse -> split -> embed -> write, connected by bounded queues.
+
+    Only products whose content changed since the last load are split and embedded, and each
+    stage only holds a queue's worth of items, so memory stays flat as the catalog grows.
+    """
+
+    def __init__(self, rdb, stored, docs_dir=settings.DOCS_DIR):
+        self.rdb = rdb
+        self.stored = stored
+        self.docs_dir = docs_dir
+        self.text_splitter = TextSplitter(chunk_size=512, chunk_overlap=150)
+        self.docs_queue = asyncio.Queue(maxsize=settings.LOADER_QUEUE_SIZE)
+        self.embed_queue = asyncio.Queue(maxsize=settings.LOADER_QUEUE_SIZE)
+        self.write_queue = asyncio.Queue(maxsize=settings.LOADER_QUEUE_SIZE)
+        self.stats = {name: StageStats(name) for name in ('parse', 'split', 'embed', 'write')}
+        self.counts = {'unchanged': 0, 'metadata-only': 0, 'changed': 0, 'removed': 0}
+        self.failed_chunks = 0
+        self.seen = set()
+        self.pending = {}
+        self.new_states = {}
+        self.stale_ids = {}
+        self.failed_products = set()
+        self.failed_file = None
+        self.parse_errors = []
+        self.progress = tqdm(desc="Writing chunks", unit=' chunks')
+        processes = settings.LOADER_SPLIT_PROCESSES
+        self.executor = ProcessPoolExecutor(max_workers=processes) if processes > 0 else None
+
+    async def parse(self):
+        for doc in process_docs(self.docs_dir, self.parse_errors):
+            self.stats['parse'].add()
+            await self.docs_queue.put(doc)
+        await self.docs_queue.put(None)
+
+    def classify(self, doc):
+        state = self.stored.get(doc['product_id'])
+        if state is None:
+            return 'changed'
+        if state['content_hash'] == doc['content_hash']:
+            return 'unchanged'
+        if state['embed_hash'] == doc['embed_hash']:
+            return 'metadata-only'
+        return 'changed'
+
+    async def next_docs(self):
+        """Wait for the next document, then take whatever else is already queued, up to a batch."""
+        doc = await self.docs_queue.get()
+        docs = []
+        while doc is not None:
+            docs.append(doc)
+            if len(docs) >= settings.LOADER_SPLIT_BATCH_SIZE or self.docs_queue.empty():
+                break
+            doc = self.docs_queue.get_nowait()
+        return docs, doc is None
+
+    async def split_texts(self, texts):
+        if self.executor is None:
+            return self.text_splitter.split_batch(texts)
+        # تقسیم متن‌ها پردازش CPU است و در process pool انجام می‌شود تا event loop آزاد بماند
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self.text_splitter.split_batch, texts)
+
+    async def split(self):
+        batch, batch_tokens = [], 0
+        done = False
+        while not done:
+            docs, done = await self.next_docs()
+            to_split = []
+            for doc in docs:
+                if doc['product_id'] in self.seen:
+                    continue
+                self.seen.add(doc['product_id'])
+                kind = self.classify(doc)
+                if kind == 'unchanged':
+                    self.counts[kind] += 1
+                else:
+                    to_split.append((doc, kind))
+            if not to_split:
+                continue
+
+            split_results = await self.split_texts([doc['text'] for doc, _ in to_split])
+            for (doc, kind), split_chunks in zip(to_split, split_results):
+                product_id = doc['product_id']
+                chunks = doc_chunks(doc, split_chunks)
+                self.stats['split'].add(len(chunks))
+                old_count = self.stored.get(product_id, {}).get('chunks', 0)
+                if kind == 'metadata-only' and len(chunks) != old_count:
+                    kind = 'changed'
+                self.counts[kind] += 1
+                self.pending[product_id] = (product_state(doc, len(chunks)), len(chunks))
+                self.stale_ids[product_id] = chunk_ids(product_id, old_count)[len(chunks):]
+
+                if kind == 'metadata-only':
+                    # فقط متن و متادیتا به‌روز می‌شود و بردار قبلی حفظ می‌شود
+                    await self.write_queue.put(('update', [chunk for chunk, _ in chunks]))
+                    continue
+
+                for chunk, size in chunks:
+                    if batch and (
+                        batch_tokens + size > settings.EMBEDDING_BATCH_TOKENS
+                        or len(batch) >= settings.EMBEDDING_BATCH_SIZE
+                    ):
+                        await self.embed_queue.put(batch)
+                        batch, batch_tokens = [], 0
+                    batch.append(chunk)
+                    batch_tokens += size
+        if batch:
+            await self.embed_queue.put(batch)
+
+    async def embed(self):
+        while (batch := await self.embed_queue.get()) is not None:
             try:
-                batch_vectors = await get_embeddings([chunk['text'] for chunk in batch])
-                vectors.extend(batch_vectors)
-                pbar.update(len(batch))
+                vectors = await embed_with_retry([chunk['text'] for chunk in batch])
             except Exception as e:
                 print(f"Error embedding batch: {e}")
-                vectors.extend([None] * len(batch))
-                pbar.update(len(batch))
+                self.record_failed(batch, e)
+                continue
+            for chunk, vector in zip(batch, vectors):
+                chunk['vector'] = vector
+            self.stats['embed'].add(len(batch))
+            await self.write_queue.put(('upsert', batch))
 
-    for chunk, vector in zip(chunks, vectors):
-        chunk['vector'] = vector if vector else [0.0] * 1536  # Fallback vector
+    def record_failed(self, batch, error):
+        if self.failed_file is None:
+            self.failed_file = open(FAILED_CHUNKS_FILE, 'w', encoding='utf-8')
+        for chunk in batch:
+            self.failed_file.write(json.dumps({**chunk, 'error': str(error)}, ensure_ascii=False) + '\n')
+            self.failed_products.add(chunk['metadata']['product_id'])
+        self.failed_chunks += len(batch)
 
-    return chunks
+    async def write(self):
+        upserts, updates = [], []
 
-async def load_knowledge_base():
+        async def flush():
+            if upserts:
+                await add_chunks_to_vector_db(self.rdb, upserts)
+            if updates:
+                await update_chunks_metadata(self.rdb, updates)
+            states = {}
+            for chunk in upserts + updates:
+                product_id = chunk['metadata']['product_id']
+                state, remaining = self.pending[product_id]
+                self.pending[product_id] = (state, remaining - 1)
+                if remaining == 1 and product_id not in self.failed_products:
+                    states[product_id] = state
+            await save_product_states(self.rdb, states)
+            self.new_states.update(states)
+            self.stats['write'].add(len(upserts) + len(updates))
+            self.progress.update(len(upserts) + len(updates))
+            upserts.clear()
+            updates.clear()
+
+        while (item := await self.write_queue.get()) is not None:
+            op, chunks = item
+            (upserts if op == 'upsert' else updates).extend(chunks)
+            if len(upserts) + len(updates) >= settings.LOADER_WRITE_BATCH_SIZE:
+                await flush()
+        await flush()
+
+    async def run(self):
+        async def split_then_stop_embedders():
+            await self.split()
+            for _ in range(settings.EMBEDDING_CONCURRENCY):
+                await self.embed_queue.put(None)
+
+        async def embed_then_stop_writer():
+            await asyncio.gather(*(self.embed() for _ in range(settings.EMBEDDING_CONCURRENCY)))
+            await self.write_queue.put(None)
+
+        try:
+            await asyncio.gather(self.parse(), split_then_stop_embedders(), embed_then_stop_writer(), self.write())
+        finally:
+            self.progress.close()
+            if self.executor is not None:
+                self.executor.shutdown()
+            if self.failed_file is not None:
+                self.failed_file.close()
+
+        # محصولاتی که embedding آن‌ها شکست خورده نسخه قبلی خود را نگه می‌دارند و در اجرای بعدی دوباره تلاش می‌شوند
+        stale_ids = [
+            chunk_id for product_id, ids in self.stale_ids.items()
+            if product_id in self.new_states for chunk_id in ids
+        ]
+        # اگر بخشی از فایل‌ها خوانده نشد، محصولات دیده‌نشده را حذف نمی‌کنیم چون ممکن است فقط بعد از خطا آمده باشند
+        removed = set() if self.parse_errors else self.stored.keys() - self.seen
+        for product_id in removed:
+            stale_ids.extend(chunk_ids(product_id, self.stored[product_id]['chunks']))
+        await delete_chunks(self.rdb, stale_ids)
+        await delete_products(self.rdb, removed)
+        await delete_product_states(self.rdb, removed)
+        self.counts['removed'] = len(removed)
+        return bool(self.new_states or removed)
+
+    def report(self):
+        print('\nProducts: ' + ', '.join(f'{n} {kind}' for kind, n in self.counts.items()))
+        for stats in self.stats.values():
+            print(stats)
+        if self.failed_chunks:
+            print(f'{self.failed_chunks} chunks failed to embed, saved to {FAILED_CHUNKS_FILE}')
+            print('Run `load` again to retry them')
+        if self.parse_errors:
+            print(f'{len(self.parse_errors)} catalog files failed to parse, removed products were not pruned:')
+            for file_path, error in self.parse_errors:
+                print(f'  {file_path}: {error}')
+
+
+async def build_lexical_index(rdb):
+    """Rebuild the BM25 index page by page from the stored chunks, keeping only its postings in memory."""
+    builder = LexicalIndexBuilder()
+    async for chunks in iter_lexical_chunks(rdb):
+        for chunk in chunks:
+            builder.add(chunk)
+    await save_lexical_index(rdb, builder.build().to_bytes())
+
+async def load_knowledge_base(full=False):
     async with get_redis() as rdb:
         print('Setting up Redis database')
-        await setup_db(rdb)
-        chunks = await process_docs()
-        if chunks:
-            print('\nAdding chunks to vector db')
-            await add_chunks_to_vector_db(rdb, chunks)
-            print('\nKnowledge base loaded')
+        if full:
+            await setup_db(rdb)
+            stored = {}
         else:
-            print('\nNo chunks to add to vector db')
+            await ensure_db(rdb)
+            stored = await get_product_states(rdb)
+
+        print('\nSyncing catalog')
+        sync = CatalogSync(rdb, stored)
+        changed = await sync.run()
+        sync.report()
+
+        # بعد از setup_db کاتالوگ قبلی پاک شده است، پس نسخه باید حتی بدون تغییر بالا برود تا workerها آن را رها کنند
+        if not changed and not full:
+            print('\nKnowledge base is up to date')
+            return
+        print('Building lexical index')
+        await build_lexical_index(rdb)
+        version = await bump_catalog_version(rdb)
+        print(f'\nKnowledge base loaded (catalog version {version})')
 
 def main():
-    asyncio.run(load_knowledge_base())
+    parser = argparse.ArgumentParser(description='Load the product catalog into the knowledge base')
+    parser.add_argument(
+        '--full', action='store_true', help='drop the vector index and re-embed every product'
+    )
+    args = parser.parse_args()
+    asyncio.run(load_knowledge_base(full=args.full))
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
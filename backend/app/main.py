@@ -1,9 +1,32 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from app.api import router
+from app.db import create_redis_pool, get_redis, ensure_answer_index
+from app.openai import get_embedding_cache_stats, embedding_batcher
+from app.assistants.tools import get_kb_result_cache_stats
+from app.utils.generations import GenerationRegistry
+from app.utils.metrics import (
+    ServerTimingMiddleware, render_metrics, redis_pool_connections, redis_pool_wait, generations_in_flight,
+    generations_total, cache_lookups
+)
 from app.config import settings
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app):
+    # یک connection pool مشترک برای کل عمر worker
+    app.state.redis_pool = create_redis_pool()
+    app.state.rdb = get_redis(app.state.redis_pool)
+    app.state.generations = GenerationRegistry(settings.MAX_CONCURRENT_GENERATIONS)
+    if settings.ANSWER_CACHE_ENABLED:
+        await ensure_answer_index(app.state.rdb)
+    yield
+    await app.state.generations.drain(settings.GENERATION_DRAIN_TIMEOUT)
+    await app.state.rdb.aclose()
+    await app.state.redis_pool.disconnect()
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -13,9 +36,44 @@ app.add_middleware(
     allow_headers=['*'],
 )
 
+if settings.SERVER_TIMING_ENABLED:
+    app.add_middleware(ServerTimingMiddleware)
+
 app.include_router(router)
 
 @app.head('/health')
 @app.get('/health')
 def health_check():
-    return 'ok'
\ No newline at end of file
+    return 'ok'
+
+@app.get('/stats')
+def stats():
+    return {
+        'redis_pool': app.state.redis_pool.stats(),
+        'generations': app.state.generations.stats(),
+        'embedding_cache': get_embedding_cache_stats(),
+        'embedding_batcher': embedding_batcher.stats(),
+        'kb_result_cache': get_kb_result_cache_stats()
+    }
+
+def collect_stats_metrics():
+    """Copy the counters kept by the pool, the generation registry and the caches into the metrics."""
+    pool = app.state.redis_pool.stats()
+    redis_pool_connections.set(pool['in_use'], state='in_use')
+    redis_pool_connections.set(pool['idle'], state='idle')
+    redis_pool_wait.set(app.state.redis_pool.wait_time_total)
+
+    generations = app.state.generations.stats()
+    generations_in_flight.set(generations['in_flight'])
+    for result in ('completed', 'cancelled', 'rejected'):
+        generations_total.set(generations[result], result=result)
+
+    for cache, stats in (('embedding', get_embedding_cache_stats()), ('kb_result', get_kb_result_cache_stats())):
+        for tier, counts in stats.items():
+            cache_lookups.set(counts['hits'], cache=cache, tier=tier, result='hit')
+            cache_lookups.set(counts['misses'], cache=cache, tier=tier, result='miss')
+
+@app.get('/metrics')
+def metrics():
+    collect_stats_metrics()
+    return PlainTextResponse(render_metrics(), media_type='text/plain; version=0.0.4')
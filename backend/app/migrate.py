@@ -0,0 +1,122 @@
+import argparse
+import asyncio
+from app.db import (
+    get_redis, create_vector_index, queue_chunk_writes, hash_to_chunk, get_products_metadata,
+    bump_catalog_version, VECTOR_IDX_NAME, VECTOR_IDX_PREFIX, PRODUCT_PREFIX
+)
+from app.config import settings
+
+KEY_TYPES = {'json': b'ReJSON-RL', 'hash': b'hash'}
+
+
+async def memory_report(rdb, batch_size=500):
+    """Sum MEMORY USAGE over all chunk and product keys."""
+    report = {}
+    for name, prefix in (('chunks', VECTOR_IDX_PREFIX), ('products', PRODUCT_PREFIX)):
+        keys, total = 0, 0
+        batch = []
+        async for key in rdb.scan_iter(match=prefix + '*', count=batch_size):
+            batch.append(key)
+            if len(batch) >= batch_size:
+                total += await batch_memory(rdb, batch)
+                keys += len(batch)
+                batch = []
+        if batch:
+            total += await batch_memory(rdb, batch)
+            keys += len(batch)
+        report[name] = (keys, total)
+    return report
+
+async def batch_memory(rdb, keys):
+    async with rdb.pipeline(transaction=False) as pipe:
+        for key in keys:
+            pipe.memory_usage(key, samples=0)
+        return sum(n or 0 for n in await pipe.execute())
+
+def print_report(title, report):
+    n_chunks = report['chunks'][0] or 1
+    total = sum(size for _, size in report.values())
+    print(f'\n{title}')
+    for name, (keys, size) in report.items():
+        print(f'  {name:<9} {keys:>8} keys {size / 1024 / 1024:>10.2f} MiB')
+    print(f'  {"total":<9} {"":>13} {total / 1024 / 1024:>10.2f} MiB ({total / n_chunks:.0f} bytes per chunk)')
+
+async def read_chunks(rdb, keys, source):
+    async with rdb.pipeline(transaction=False) as pipe:
+        for key in keys:
+            pipe.type(key)
+            if source == 'json':
+                pipe.json().get(key)
+            else:
+                pipe.hgetall(key)
+        res = await pipe.execute()
+    # کلیدهایی که قبلاً تبدیل شده‌اند (اجرای دوباره یا تکرار در SCAN) کنار گذاشته می‌شوند
+    docs = [(key, doc) for key, key_type, doc in zip(keys, res[::2], res[1::2]) if key_type == KEY_TYPES[source]]
+    if source == 'json':
+        return docs
+    chunks = [(key, hash_to_chunk(fields)) for key, fields in docs]
+    products = await get_products_metadata(rdb, {chunk['product_id'] for _, chunk in chunks})
+    return [(key, {
+        'chunk_id': chunk['chunk_id'],
+        'text': chunk['text'],
+        'doc_name': chunk['doc_name'],
+        'vector': chunk['vector'].tolist(),
+        'metadata': products.get(chunk['product_id'], {})
+    }) for key, chunk in chunks]
+
+async def migrate_batch(rdb, keys, source, target):
+    chunks = await read_chunks(rdb, keys, source)
+    async with rdb.pipeline(transaction=False) as pipe:
+        for key, _ in chunks:
+            pipe.delete(key)
+        queue_chunk_writes(pipe, [chunk for _, chunk in chunks], storage=target)
+        await pipe.execute()
+    return len(chunks)
+
+async def migrate_storage(target, batch_size=500):
+    source = 'json' if target == 'hash' else 'hash'
+    async with get_redis() as rdb:
+        print_report(f'Before ({source})', await memory_report(rdb))
+
+        try:
+            await rdb.ft(VECTOR_IDX_NAME).dropindex(delete_documents=False)
+        except Exception as e:
+            print(f"Index '{VECTOR_IDX_NAME}': {e}")
+
+        migrated = 0
+        batch = []
+        async for key in rdb.scan_iter(match=VECTOR_IDX_PREFIX + '*', count=batch_size):
+            batch.append(key)
+            if len(batch) >= batch_size:
+                migrated += await migrate_batch(rdb, batch, source, target)
+                batch = []
+        if batch:
+            migrated += await migrate_batch(rdb, batch, source, target)
+        if target == 'json':
+            async for key in rdb.scan_iter(match=PRODUCT_PREFIX + '*', count=batch_size):
+                await rdb.delete(key)
+        print(f'\nMigrated {migrated} chunks from {source} to {target}')
+
+        await create_vector_index(rdb, storage=target)
+        await bump_catalog_version(rdb)
+        print_report(f'After ({target})', await memory_report(rdb))
+    if settings.VECTOR_STORAGE != target:
+        print(f'\nSet VECTOR_STORAGE={target} and restart the API to use the new layout')
+
+async def report():
+    async with get_redis() as rdb:
+        print_report(f'Current layout ({settings.VECTOR_STORAGE})', await memory_report(rdb))
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert stored chunks between JSON and binary HASH layouts')
+    parser.add_argument('--to', choices=['json', 'hash'], help='target storage layout')
+    parser.add_argument('--report', action='store_true', help='only print the memory report')
+    args = parser.parse_args()
+    if args.report or not args.to:
+        asyncio.run(report())
+    else:
+        asyncio.run(migrate_storage(args.to))
+
+
+if __name__ == '__main__':
+    main()
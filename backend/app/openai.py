@@ -1,25 +1,118 @@
+import hashlib
+import numpy as np
 import tiktoken
 from openai import AsyncOpenAI
 from app.config import settings
+from app.utils.lru_cache import LRUCache
+from app.utils.embedding_batcher import EmbeddingBatcher
+from app.utils.text import normalize_text
+from app.utils.metrics import span, timed
 
-client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
+EMBEDDING_CACHE_PREFIX = 'embedding:'
+
+client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY, base_url=settings.OPENAI_BASE_URL)
 tokenizer = tiktoken.encoding_for_model(settings.MODEL)
 
+# کش دو لایه برای بردار کوئری‌ها: LRU داخل پروسه و Redis مشترک بین workerها
+embedding_cache = LRUCache(settings.EMBEDDING_CACHE_SIZE, ttl=settings.EMBEDDING_CACHE_TTL)
+embedding_cache_redis_stats = {'hits': 0, 'misses': 0}
+
 def token_size(text):
     return len(tokenizer.encode(text))
 
-async def get_embedding(input, model=settings.EMBEDDING_MODEL, dimensions=settings.EMBEDDING_DIMENSIONS):
-    res = await client.embeddings.create(input=input, model=model, dimensions=dimensions)
-    return res.data[0].embedding
+def token_sizes(texts):
+    return [len(tokens) for tokens in tokenizer.encode_batch(texts)]
+
+def truncate_tokens(text, max_tokens):
+    """Cut text to at most max_tokens tokens, returning the text and its token size."""
+    tokens = tokenizer.encode(text)
+    if len(tokens) <= max_tokens:
+        return text, len(tokens)
+    return tokenizer.decode(tokens[:max_tokens]), max_tokens
+
+async def embed_texts(texts, model, dimensions):
+    with span('openai.embeddings'):
+        res = await client.embeddings.create(input=texts, model=model, dimensions=dimensions)
+    return [d.embedding for d in res.data]
+
+# بردار کوئری‌های هم‌زمان چند چت با یک درخواست به API گرفته می‌شود
+embedding_batcher = EmbeddingBatcher(
+    embed_texts, settings.QUERY_EMBEDDING_BATCH_WINDOW_MS / 1000, settings.QUERY_EMBEDDING_BATCH_MAX_SIZE
+)
+
+def embedding_cache_key(text, model, dimensions):
+    digest = hashlib.sha1(normalize_text(text).encode()).hexdigest()
+    return f'{EMBEDDING_CACHE_PREFIX}{model}:{dimensions}:{digest}'
+
+def get_embedding_cache_stats():
+    return {'local': embedding_cache.stats(), 'redis': dict(embedding_cache_redis_stats)}
+
+async def get_query_embeddings(
+    inputs, model=settings.EMBEDDING_MODEL, dimensions=settings.EMBEDDING_DIMENSIONS, rdb=None
+):
+    """Embed several query texts through the cache, sending the misses through the embedding batcher."""
+    keys = [embedding_cache_key(text, model, dimensions) for text in inputs]
+    vectors = [embedding_cache.get(key) for key in keys]
 
-async def get_embeddings(input, model=settings.EMBEDDING_MODEL, dimensions=settings.EMBEDDING_DIMENSIONS):
-    res = await client.embeddings.create(input=input, model=model, dimensions=dimensions)
+    missing = [i for i, vector in enumerate(vectors) if vector is None]
+    if missing and rdb is not None:
+        cached = await rdb.mget([keys[i] for i in missing])
+        for i, value in zip(missing, cached):
+            if value is not None:
+                vectors[i] = np.frombuffer(value, dtype=np.float32)
+                embedding_cache.set(keys[i], vectors[i])
+        embedding_cache_redis_stats['hits'] += sum(value is not None for value in cached)
+        embedding_cache_redis_stats['misses'] += sum(value is None for value in cached)
+        missing = [i for i in missing if vectors[i] is None]
+
+    if missing:
+        # متن‌های تکراری در یک درخواست فقط یک بار embed می‌شوند
+        texts = {}
+        for i in missing:
+            texts.setdefault(keys[i], inputs[i])
+        embeddings = await embedding_batcher.embed(list(texts.values()), model, dimensions)
+        fresh = {}
+        for key, embedding in zip(texts, embeddings):
+            vector = np.asarray(embedding, dtype=np.float32)
+            vector.setflags(write=False)
+            fresh[key] = vector
+            embedding_cache.set(key, vector)
+        for i in missing:
+            vectors[i] = fresh[keys[i]]
+        if rdb is not None:
+            async with rdb.pipeline(transaction=False) as pipe:
+                for key, vector in fresh.items():
+                    pipe.set(key, vector.tobytes(), ex=settings.EMBEDDING_CACHE_REDIS_TTL)
+                await pipe.execute()
+    return vectors
+
+async def get_embedding(input, model=settings.EMBEDDING_MODEL, dimensions=settings.EMBEDDING_DIMENSIONS, rdb=None):
+    vectors = await get_query_embeddings([input], model=model, dimensions=dimensions, rdb=rdb)
+    return vectors[0]
+
+async def get_embeddings(
+    input, model=settings.EMBEDDING_MODEL, dimensions=settings.EMBEDDING_DIMENSIONS, max_retries=None
+):
+    """Embed a batch of texts; max_retries overrides the client's own retry count for this call."""
+    api = client if max_retries is None else client.with_options(max_retries=max_retries)
+    res = await api.embeddings.create(input=input, model=model, dimensions=dimensions)
     return [d.embedding for d in res.data]
 
 def chat_stream(messages, model=settings.MODEL, temperature=0.1, **kwargs):
     return client.beta.chat.completions.stream(
+        model=model,
+        messages=messages,
+        temperature=temperature,
+        stream_options={'include_usage': True},
+        **kwargs
+    )
+
+@timed('openai.chat_completion')
+async def chat_completion(messages, model=settings.MODEL, temperature=0.1, **kwargs):
+    res = await client.chat.completions.create(
         model=model,
         messages=messages,
         temperature=temperature,
         **kwargs
     )
+    return res.choices[0].message.content
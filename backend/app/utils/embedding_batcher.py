@@ -0,0 +1,99 @@
+import asyncio
+from time import perf_counter
+from app.utils.metrics import embedding_batch_size, embedding_queue_delay
+
+class EmbeddingBatcher:
+    """Merges concurrent embedding requests into batched API calls.
+
+    Texts wait at most `window` seconds, or until `max_batch_size` texts are queued, and are then sent
+    together with one `embed(texts, model, dimensions)` call; each caller gets back its own vectors.
+    With a window of 0 only the texts of a single call are sent together.
+    """
+
+    def __init__(self, embed, window, max_batch_size):
+        self.embed_batch = embed
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self._pending = {}
+        self._timers = {}
+        self._tasks = set()
+        self.requests = 0
+        self.texts = 0
+        self.batches = 0
+        self.full_batches = 0
+        self.largest_batch = 0
+        self.errors = 0
+        self.queue_delay_total = 0.0
+        self.queue_delay_max = 0.0
+
+    async def embed(self, texts, model, dimensions):
+        loop = asyncio.get_running_loop()
+        # بردارها فقط بین درخواست‌های هم‌مدل و هم‌بعد قابل اشتراک هستند
+        key = (model, dimensions)
+        self.requests += 1
+        futures = []
+        for text in texts:
+            future = loop.create_future()
+            self._pending.setdefault(key, []).append((text, future, perf_counter()))
+            futures.append(future)
+            if len(self._pending[key]) >= self.max_batch_size:
+                self.full_batches += 1
+                self._flush(key)
+
+        if key in self._pending and key not in self._timers:
+            if self.window:
+                self._timers[key] = loop.call_later(self.window, self._flush, key)
+            else:
+                self._flush(key)
+        return await asyncio.gather(*futures)
+
+    def _flush(self, key):
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        batch = self._pending.pop(key, None)
+        if batch:
+            task = asyncio.create_task(self._send(key, batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, key, batch):
+        sent = perf_counter()
+        for _, _, queued in batch:
+            delay = sent - queued
+            self.queue_delay_total += delay
+            self.queue_delay_max = max(self.queue_delay_max, delay)
+            embedding_queue_delay.observe(delay)
+        texts = list(dict.fromkeys(text for text, _, _ in batch))
+        self.texts += len(batch)
+        self.batches += 1
+        self.largest_batch = max(self.largest_batch, len(batch))
+        embedding_batch_size.observe(len(batch))
+
+        try:
+            vectors = dict(zip(texts, await self.embed_batch(texts, *key)))
+        except Exception as e:
+            self.errors += 1
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        # درخواست‌هایی که در این فاصله لغو شده‌اند (قطع کلاینت) نتیجه نمی‌گیرند
+        for text, future, _ in batch:
+            if not future.done():
+                future.set_result(vectors[text])
+
+    def stats(self):
+        return {
+            'window_ms': self.window * 1000,
+            'max_batch_size': self.max_batch_size,
+            'requests': self.requests,
+            'texts': self.texts,
+            'batches': self.batches,
+            'full_batches': self.full_batches,
+            'avg_batch_size': self.texts / self.batches if self.batches else 0.0,
+            'largest_batch': self.largest_batch,
+            'errors': self.errors,
+            'queue_delay_avg_ms': 1000 * self.queue_delay_total / self.texts if self.texts else 0.0,
+            'queue_delay_max_ms': 1000 * self.queue_delay_max
+        }
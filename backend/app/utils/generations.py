@@ -0,0 +1,76 @@
+import asyncio
+
+class GenerationRegistry:
+    """Tracks the in-flight reply generations of this worker and caps how many run at once.
+
+    A slot is reserved with `reserve` before the turn is stored and handed over to the task by `start`,
+    so the cap also holds while requests are still talking to Redis. Follow-up work that runs after the
+    reply is streamed goes through `run_in_background`, which holds no slot but is still drained.
+    """
+
+    def __init__(self, max_concurrent):
+        self.max_concurrent = max_concurrent
+        self.tasks = set()
+        self.background = set()
+        self.active = 0
+        self.draining = False
+        self.started = 0
+        self.completed = 0
+        self.cancelled = 0
+        self.rejected = 0
+
+    def reserve(self):
+        if self.draining or self.active >= self.max_concurrent:
+            self.rejected += 1
+            return False
+        self.active += 1
+        return True
+
+    def release(self):
+        self.active -= 1
+
+    def start(self, coro):
+        """Run coro as a tracked task in a slot taken with `reserve`."""
+        task = asyncio.create_task(coro)
+        self.tasks.add(task)
+        self.started += 1
+        task.add_done_callback(self._finished)
+        return task
+
+    def run_in_background(self, coro):
+        task = asyncio.create_task(coro)
+        self.background.add(task)
+        task.add_done_callback(self.background.discard)
+        return task
+
+    def _finished(self, task):
+        self.tasks.discard(task)
+        self.release()
+        if task.cancelled():
+            self.cancelled += 1
+        else:
+            self.completed += 1
+
+    async def drain(self, timeout):
+        """Stop accepting generations, wait up to timeout seconds for running ones, then cancel the rest."""
+        self.draining = True
+        tasks = self.tasks | self.background
+        if not tasks:
+            return
+        print(f'Waiting for {len(tasks)} in-flight generations')
+        _, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.wait(pending)
+            print(f'Cancelled {len(pending)} generations after {timeout}s')
+
+    def stats(self):
+        return {
+            'in_flight': self.active,
+            'max_concurrent': self.max_concurrent,
+            'started': self.started,
+            'completed': self.completed,
+            'cancelled': self.cancelled,
+            'rejected': self.rejected
+        }
@@ -0,0 +1,191 @@
+import functools
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import perf_counter
+from starlette.datastructures import MutableHeaders
+
+# Minimal Prometheus text exposition, so the metrics endpoint needs no extra dependency.
+# Values are per worker process.
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+registry = []
+
+# زمان‌بندی مراحل درخواست جاری برای هدر Server-Timing
+request_timings = ContextVar('request_timings', default=None)
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{escape_label(value)}"' for name, value in labels) + '}'
+
+def format_value(value):
+    return str(value) if isinstance(value, int) else repr(float(value))
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.values = {}
+        if not self.labels and self.type != 'histogram':
+            self.values[()] = 0
+        registry.append(self)
+
+    def key(self, labels):
+        return tuple((name, labels.get(name, '')) for name in self.labels)
+
+    def samples(self):
+        for key, value in self.values.items():
+            yield self.name, key, value
+
+    def set(self, value, **labels):
+        """Set the value directly, for metrics that mirror stats kept elsewhere."""
+        self.values[self.key(labels)] = value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.type}']
+        for name, key, value in self.samples():
+            lines.append(f'{name}{format_labels(key)} {format_value(value)}')
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, value=1, **labels):
+        key = self.key(labels)
+        self.values[key] = self.values.get(key, 0) + value
+
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def inc(self, value=1, **labels):
+        key = self.key(labels)
+        self.values[key] = self.values.get(key, 0) + value
+
+    def dec(self, value=1, **labels):
+        self.inc(-value, **labels)
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        counts, total, n = self.values.get(key, ([0] * len(self.buckets), 0.0, 0))
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+        self.values[key] = (counts, total + value, n + 1)
+
+    def samples(self):
+        for key, (counts, total, n) in self.values.items():
+            for bound, count in zip(self.buckets, counts):
+                yield f'{self.name}_bucket', key + (('le', f'{bound:g}'),), count
+            yield f'{self.name}_bucket', key + (('le', '+Inf'),), n
+            yield f'{self.name}_sum', key, total
+            yield f'{self.name}_count', key, n
+
+
+def render_metrics():
+    return '\n'.join(metric.render() for metric in registry) + '\n'
+
+
+stage_duration = Histogram('neurabot_stage_duration_seconds', 'Duration of each stage of a request', ('stage',))
+time_to_first_token = Histogram(
+    'neurabot_time_to_first_token_seconds', 'Time from the start of an LLM call to its first content delta', ('call',)
+)
+llm_tokens = Counter('neurabot_llm_tokens_total', 'Tokens sent to and received from the chat model', ('call', 'direction'))
+tool_calls = Counter('neurabot_tool_calls_total', 'Knowledge base tool calls made by the model')
+tool_calls_per_turn = Histogram(
+    'neurabot_tool_calls_per_turn', 'Knowledge base tool calls per chat turn', buckets=(0, 1, 2, 3, 5)
+)
+context_tokens = Histogram(
+    'neurabot_context_tokens', 'Prompt tokens per chat turn by part of the context', ('part',),
+    buckets=(0, 100, 250, 500, 1000, 2000, 4000, 8000, 16000)
+)
+chunks_scanned = Counter('neurabot_chunks_scanned_total', 'Chunks scored by vector searches', ('source',))
+chat_turns = Counter('neurabot_chat_turns_total', 'Chat turns by outcome', ('result',))
+active_streams = Gauge('neurabot_active_sse_streams', 'SSE streams currently open')
+redis_pool_connections = Gauge('neurabot_redis_pool_connections', 'Redis pool connections by state', ('state',))
+redis_pool_wait = Counter('neurabot_redis_pool_wait_seconds_total', 'Time spent waiting for a Redis connection')
+generations_in_flight = Gauge('neurabot_generations_in_flight', 'Reply generations currently running')
+generations_total = Counter('neurabot_generations_total', 'Finished or rejected reply generations', ('result',))
+embedding_batch_size = Histogram(
+    'neurabot_embedding_batch_size', 'Texts per batched query embedding request', buckets=(1, 2, 4, 8, 16, 32, 64, 128)
+)
+embedding_queue_delay = Histogram(
+    'neurabot_embedding_queue_delay_seconds', 'Time a query text waits for its embedding batch to be sent',
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1)
+)
+cache_lookups = Counter('neurabot_cache_lookups_total', 'Cache lookups by cache, tier and result', ('cache', 'tier', 'result'))
+
+
+@contextmanager
+def span(stage):
+    """Time a block as one stage, for the stage histogram and the Server-Timing header."""
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        duration = perf_counter() - start
+        stage_duration.observe(duration, stage=stage)
+        timings = request_timings.get()
+        if timings is not None:
+            timings.append((stage, duration))
+
+def timed(stage):
+    """Decorator version of `span` for coroutine functions."""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with span(stage):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def server_timing_header(timings):
+    return ', '.join(f'{stage.replace(".", "-")};dur={duration * 1000:.1f}' for stage, duration in timings)
+
+
+class ServerTimingMiddleware:
+    """ASGI middleware that reports the spans of each request in a Server-Timing header.
+
+    Only spans that finish before the response starts are included; for SSE responses that is the
+    work done before streaming, such as storing the turn.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        timings = []
+        token = request_timings.set(timings)
+        start = perf_counter()
+
+        async def send_with_timing(message):
+            if message['type'] == 'http.response.start':
+                timings.append(('app', perf_counter() - start))
+                MutableHeaders(scope=message).append('Server-Timing', server_timing_header(timings))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            request_timings.reset(token)
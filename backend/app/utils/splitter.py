@@ -2,7 +2,7 @@
 # https://github.com/run-llama/llama_index/blob/main/llama-index-core/llama_index/core/node_parser/text/sentence.py
 import nltk
 from functools import partial
-from app.openai import token_size
+from app.openai import token_size, token_sizes
 
 sentence_tokenizer = nltk.tokenize.PunktSentenceTokenizer()
 
@@ -19,6 +19,14 @@ def split_sentences(text):
 
 
 class TextSplitter:
+    # Each split is tokenized once and a chunk's size is estimated as the sum of its splits' sizes.
+    # BPE can merge or split tokens across each boundary, so once an estimate comes within
+    # `margin(limit)` tokens of a limit the candidate text is encoded and decided on its exact size.
+    # The margin only sets how close to a limit the estimate is still trusted, trading speed for
+    # how often the concatenation is encoded.
+    MIN_MARGIN = 16
+    MARGIN_RATIO = 0.25
+
     def __init__(self, chunk_size, chunk_overlap=0):
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
@@ -28,53 +36,87 @@ class TextSplitter:
             split_sentences,
             partial(split_by_separator, sep=' ')
         ]
-    
-    def _split_recursive(self, text, level=0):
-        if token_size(text) <= self.chunk_size or level == len(self.splitters):
-            return [text]
-        
+
+    def _split_recursive(self, text, size, level=0):
+        if size <= self.chunk_size or level == len(self.splitters):
+            return [(text, size)]
+
         splits = []
         for s in self.splitters[level](text):
-            if token_size(s) <= self.chunk_size:
-                splits.append(s)
+            s_size = token_size(s)
+            if s_size <= self.chunk_size:
+                splits.append((s, s_size))
             else:
-                splits.extend(self._split_recursive(s, level + 1))
+                splits.extend(self._split_recursive(s, s_size, level + 1))
         return splits
 
+    def margin(self, limit):
+        return max(self.MIN_MARGIN, int(limit * self.MARGIN_RATIO))
+
+    def _exceeds(self, estimate, limit, text):
+        """Decide `token_size(text()) > limit`, returning the decision and the size (exact if encoded)."""
+        if estimate <= limit - self.margin(limit):
+            return False, (estimate, False)
+        size = token_size(text())
+        return size > limit, (size, True)
+
     def _merge_splits(self, splits):
         chunks = []
-        current_chunk = ''
         current_splits = []
+        # تعداد توکن چانک جاری و این‌که دقیق (encode شده) است یا جمع اندازه تکه‌ها
+        current_size = (0, True)
+
+        for split, size in splits:
+            if current_splits:
+                exceeds, joined = self._exceeds(
+                    current_size[0] + size, self.chunk_size, lambda: ''.join(s for s, _ in current_splits) + split
+                )
+            else:
+                exceeds, joined = False, (size, True)
 
-        for split in splits:
-            if current_chunk and (token_size(current_chunk + split) > self.chunk_size):
-                trimmed_chunk = current_chunk.strip()
-                if trimmed_chunk:
-                    chunks.append(trimmed_chunk)
+            if exceeds:
+                chunks.append(self._trimmed_chunk(current_splits, current_size))
                 # Add overlap to next chunk
                 last_splits = current_splits
                 current_splits = []
-                current_chunk = ''
-                for s in reversed(last_splits):
-                    if (token_size(s + current_chunk) > self.chunk_overlap or
-                        token_size(s + current_chunk + split) > self.chunk_size
-                    ):
+                overlap_size = (0, True)
+                for s, s_size in reversed(last_splits):
+                    current_text = lambda: s + ''.join(c for c, _ in current_splits)
+                    too_long, overlap = self._exceeds(overlap_size[0] + s_size, self.chunk_overlap, current_text)
+                    if too_long:
+                        break
+                    too_long, _ = self._exceeds(overlap[0] + size, self.chunk_size, lambda: current_text() + split)
+                    if too_long:
                         break
-                    current_chunk = s + current_chunk
-                    current_splits.insert(0, s)
-
-            current_chunk += split
-            current_splits.append(split)
-        
-        trimmed_chunk = current_chunk.strip()
-        if trimmed_chunk:
-            chunks.append(trimmed_chunk)
-        return chunks
-    
+                    current_splits.insert(0, (s, s_size))
+                    overlap_size = overlap
+                joined = (overlap_size[0] + size, False) if current_splits else (size, True)
+
+            current_splits.append((split, size))
+            current_size = joined
+
+        chunks.append(self._trimmed_chunk(current_splits, current_size))
+        return [chunk for chunk in chunks if chunk[0]]
+
+    def _trimmed_chunk(self, splits, size):
+        text = ''.join(s for s, _ in splits)
+        trimmed = text.strip()
+        if trimmed == text and size[1]:
+            return trimmed, size[0]
+        return trimmed, token_size(trimmed) if trimmed else 0
+
+    def split_with_sizes(self, text, size=None):
+        """Split text into chunks, returning (chunk, token_size) pairs."""
+        if size is None:
+            size = token_size(text)
+        return self._merge_splits(self._split_recursive(text, size))
+
+    def split_batch(self, texts):
+        """Split several texts, counting the top-level tokens with a single batch encode."""
+        return [self.split_with_sizes(text, size) for text, size in zip(texts, token_sizes(texts))]
+
     def split(self, text):
-        splits = self._split_recursive(text)
-        chunks = self._merge_splits(splits)
-        return chunks
-    
+        return [chunk for chunk, _ in self.split_with_sizes(text)]
+
     def __call__(self, text):
         return self.split(text)
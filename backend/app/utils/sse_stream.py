@@ -1,10 +1,31 @@
 import asyncio
 from sse_starlette import ServerSentEvent
+from app.config import settings
 
 class SSEStream:
-    def __init__(self) -> None:
-        self._queue = asyncio.Queue()
+    """Stream of reply deltas to one client.
+
+    Deltas are coalesced into a single event once flush_size characters are buffered or flush_interval
+    seconds have passed since the first buffered delta; setting both to 0 sends every delta as is.
+    The queue is bounded, so a slow client blocks `send` instead of buffering without limit: once the
+    queue is full, `send` waits for the buffered deltas to be queued.
+    """
+
+    def __init__(
+        self,
+        flush_interval=settings.SSE_FLUSH_INTERVAL_MS / 1000,
+        flush_size=settings.SSE_FLUSH_SIZE,
+        max_queue_size=settings.SSE_QUEUE_SIZE
+    ) -> None:
+        self._queue = asyncio.Queue(max_queue_size)
         self._stream_end = object()
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self._buffer = []
+        self._buffer_size = 0
+        self._generation = 0
+        self._flush_lock = asyncio.Lock()
+        self._timers = set()
 
     def __aiter__(self):
         return self
@@ -13,10 +34,50 @@ class SSEStream:
         data = await self._queue.get()
         if data is self._stream_end:
             raise StopAsyncIteration
-        return ServerSentEvent(data=data)
+        return data if isinstance(data, ServerSentEvent) else ServerSentEvent(data=data)
 
     async def send(self, data):
-        await self._queue.put(data)
+        if not self.flush_size and not self.flush_interval:
+            await self._queue.put(data)
+            return
+
+        self._buffer.append(data)
+        self._buffer_size += len(data)
+        if (self.flush_size and self._buffer_size >= self.flush_size) or self._queue.full():
+            await self._flush()
+        elif self.flush_interval and len(self._buffer) == 1:
+            timer = asyncio.create_task(self._flush_after(self._generation))
+            self._timers.add(timer)
+            timer.add_done_callback(self._timers.discard)
+
+    async def _flush_after(self, generation):
+        await asyncio.sleep(self.flush_interval)
+        await self._flush(generation)
+
+    async def _flush(self, generation=None):
+        # قفل ترتیب رویدادها را حفظ می‌کند وقتی تایمر و send هم‌زمان منتظر جا در صف هستند
+        async with self._flush_lock:
+            if not self._buffer or (generation is not None and generation != self._generation):
+                return
+            data = ''.join(self._buffer)
+            self._buffer = []
+            self._buffer_size = 0
+            self._generation += 1
+            await self._queue.put(data)
+
+    async def send_event(self, event, data):
+        """Send a named event after the deltas buffered so far; clients reading plain messages skip it."""
+        await self._flush()
+        async with self._flush_lock:
+            await self._queue.put(ServerSentEvent(data=data, event=event))
+
+    def cancel_timers(self):
+        for timer in list(self._timers):
+            timer.cancel()
 
     async def close(self):
-        await self._queue.put(self._stream_end)
+        # flush پس از پایان flushهای در جریان تایمرها اجرا می‌شود، پس تایمرهای باقی‌مانده کاری ندارند
+        await self._flush()
+        async with self._flush_lock:
+            await self._queue.put(self._stream_end)
+        self.cancel_timers()
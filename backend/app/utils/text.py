@@ -0,0 +1,42 @@
+import re
+
+PERSIAN_CHAR_MAP = str.maketrans({
+    'ي': 'ی', 'ى': 'ی', 'ئ': 'ی', 'ك': 'ک', 'ة': 'ه', 'ۀ': 'ه', 'ؤ': 'و',
+    'أ': 'ا', 'إ': 'ا', 'ٱ': 'ا', 'آ': 'ا',
+    '\u0640': None,  # کشیده
+    '\u200c': ' ',   # نیم‌فاصله
+    **{chr(0x06F0 + i): str(i) for i in range(10)},  # ارقام فارسی
+    **{chr(0x0660 + i): str(i) for i in range(10)},  # ارقام عربی
+})
+DIACRITICS_RE = re.compile('[\u064b-\u065f\u0670]')
+WHITESPACE_RE = re.compile(r'\s+')
+TOKEN_RE = re.compile(r'[^\W\d_]+|\d+')
+
+PERSIAN_SUFFIXES = ('هایی', 'های', 'ها')
+
+STOPWORDS = {
+    'و', 'در', 'به', 'از', 'که', 'با', 'برای', 'این', 'ان', 'را', 'رو', 'یا', 'تا', 'هم', 'یک', 'یه',
+    'ها', 'های', 'هایی', 'ای', 'است', 'هست', 'هستن', 'می', 'من', 'میخوام', 'میخواهم', 'دارید',
+    'دارین', 'چی', 'چه', 'ولی', 'اما', 'بر', 'اگر', 'اگه', 'نه', 'باشه', 'کنم', 'کن', 'بده',
+    'the', 'a', 'an', 'and', 'or', 'of', 'for', 'with', 'in', 'to'
+}
+
+
+def normalize_text(text):
+    """Normalize Persian/Arabic letter variants, digits, diacritics and whitespace."""
+    text = DIACRITICS_RE.sub('', text.translate(PERSIAN_CHAR_MAP))
+    return WHITESPACE_RE.sub(' ', text).strip().lower()
+
+def normalize_brand(brand):
+    """Canonical form of a brand name used both when indexing products and when filtering by brand,
+    so that case, letter variants, punctuation and spacing differences still match (LS2, ls-2, Ls 2)."""
+    return ' '.join(TOKEN_RE.findall(normalize_text(str(brand))))
+
+def stem(token):
+    for suffix in PERSIAN_SUFFIXES:
+        if token.endswith(suffix) and len(token) - len(suffix) >= 2:
+            return token[:-len(suffix)]
+    return token
+
+def tokenize(text):
+    return [stem(t) for t in TOKEN_RE.findall(normalize_text(text)) if t not in STOPWORDS]
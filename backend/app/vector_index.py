@@ -0,0 +1,101 @@
+import asyncio
+import numpy as np
+from app.db import get_all_vectors, get_catalog_version, get_lexical_index
+from app.lexical_index import LexicalIndex
+from app.utils.text import normalize_brand
+from app.utils.metrics import span, chunks_scanned
+from app.config import settings
+
+
+class VectorIndex:
+    """In-process snapshot of the knowledge base, scored with a single matrix-vector product."""
+
+    def __init__(self, chunks, version, lexical=None):
+        chunks = [
+            c for c in chunks
+            if c.get('vector') is not None and len(c['vector']) == settings.EMBEDDING_DIMENSIONS
+        ]
+        self.version = version
+        self.chunk_ids = [c['chunk_id'] for c in chunks]
+        self.texts = [c['text'] for c in chunks]
+        self.doc_names = [c['doc_name'] for c in chunks]
+        self.metadata = [c.get('metadata', {}) for c in chunks]
+
+        matrix = np.asarray([c['vector'] for c in chunks], dtype=np.float32)
+        if matrix.size == 0:
+            matrix = np.zeros((0, settings.EMBEDDING_DIMENSIONS), dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        self.matrix = np.ascontiguousarray(matrix / norms)
+
+        self.rows = {chunk_id: row for row, chunk_id in enumerate(self.chunk_ids)}
+        self.lexical = lexical if lexical is not None else LexicalIndex.build(chunks)
+
+    def __len__(self):
+        return len(self.chunk_ids)
+
+    def lexical_search(self, query, top_k):
+        """Return (score, row) pairs for the best BM25 matches that are present in this snapshot."""
+        return [
+            (score, self.rows[chunk_id])
+            for score, chunk_id in self.lexical.search(query, top_k)
+            if chunk_id in self.rows
+        ]
+
+    def matches_filters(self, row, filters):
+        meta = self.metadata[row]
+        for field in ('category', 'budget_range'):
+            if filters.get(field) and str(meta.get(field, '')).lower() != str(filters[field]).lower():
+                return False
+        if filters.get('brand') and normalize_brand(meta.get('brand', '')) != normalize_brand(filters['brand']):
+            return False
+        price = meta.get('price_numeric') or 0
+        if filters.get('price_min') is not None and price < filters['price_min']:
+            return False
+        if filters.get('price_max') is not None and price > filters['price_max']:
+            return False
+        if filters.get('in_stock') and not meta.get('in_stock'):
+            return False
+        return True
+
+    def search(self, query_vector, top_k, candidates=None):
+        """Return (score, row) pairs for the top_k most similar chunks, best first."""
+        if not len(self):
+            return []
+        query = np.asarray(query_vector, dtype=np.float32)
+        query_norm = np.linalg.norm(query)
+        if query_norm:
+            query = query / query_norm
+
+        rows = np.arange(len(self)) if candidates is None else candidates
+        scores = self.matrix @ query if candidates is None else self.matrix[candidates] @ query
+        chunks_scanned.inc(len(scores), source='index')
+        k = min(top_k, len(scores))
+        if not k:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(float(scores[i]), int(rows[i])) for i in top]
+
+
+_index = None
+_index_lock = asyncio.Lock()
+
+async def get_vector_index(rdb, version=None):
+    """Return the resident index, reloading it only when the catalog version in Redis changes.
+
+    Callers that already read the catalog version pass it in to save a round trip.
+    """
+    global _index
+    if version is None:
+        version = await get_catalog_version(rdb)
+    if _index is None or _index.version != version:
+        async with _index_lock:
+            if _index is None or _index.version != version:
+                with span('vector_index.load'):
+                    chunks = await get_all_vectors(rdb)
+                    lexical_blob = await get_lexical_index(rdb)
+                    lexical = LexicalIndex.from_bytes(lexical_blob) if lexical_blob else None
+                    _index = VectorIndex(chunks, version, lexical)
+                print(f'Loaded vector index v{version} with {len(_index)} chunks')
+    return _index
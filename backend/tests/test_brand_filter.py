@@ -0,0 +1,66 @@
+import asyncio
+import numpy as np
+import pytest
+from app.assistants import tools
+from app.assistants.tools import QueryKnowledgeBaseTool
+from app.db import build_filter_query
+from app.utils.text import normalize_brand
+from app.vector_index import VectorIndex
+from app.config import settings
+
+PRODUCTS = [('1', 'LS2', 'کلاه کاسکت LS2 فک متحرک'), ('2', 'Shoei', 'کلاه کاسکت Shoei فول فیس')]
+
+
+def make_chunk(product_id, brand, text):
+    vector = np.zeros(settings.EMBEDDING_DIMENSIONS, dtype=np.float32)
+    vector[int(product_id)] = 1
+    return {
+        'chunk_id': f'{product_id}:0001',
+        'text': text,
+        'doc_name': text,
+        'vector': vector,
+        'metadata': {'product_id': product_id, 'brand': brand, 'brand_key': normalize_brand(brand), 'category': 'کلاه'}
+    }
+
+@pytest.fixture
+def index(monkeypatch):
+    index = VectorIndex([make_chunk(*product) for product in PRODUCTS], version=1)
+
+    async def fake_get_vector_index(rdb, version=None):
+        return index
+
+    async def fake_search_vector_db(rdb, query_vector, top_k, filters):
+        # same pre-filter as the Redis query, applied to the resident snapshot
+        rows = [row for _, row in index.search(query_vector, top_k) if index.matches_filters(row, filters)]
+        return [{'chunk_id': index.chunk_ids[row]} for row in rows]
+
+    monkeypatch.setattr(tools, 'get_vector_index', fake_get_vector_index)
+    monkeypatch.setattr(tools, 'search_vector_db', fake_search_vector_db)
+    return index
+
+def query_vector():
+    vector = np.zeros(settings.EMBEDDING_DIMENSIONS, dtype=np.float32)
+    vector[1] = 1
+    return vector
+
+@pytest.mark.parametrize('brand', ['LS2', 'ls-2', 'Ls 2', ' ls2 '])
+def test_brand_is_normalized_at_index_and_query_time(brand):
+    assert normalize_brand(brand) == normalize_brand('LS2')
+    assert build_filter_query({'brand': brand}) == build_filter_query({'brand': 'ls 2'})
+
+def test_brand_filter_matches_variants(index):
+    tool = QueryKnowledgeBaseTool(query_input='کلاه کاسکت', brand='ls-2')
+    result = asyncio.run(tool(None, query_vector=query_vector()))
+    assert 'LS2' in result and 'Shoei' not in result
+    assert '⚠️' not in result
+
+def test_unknown_brand_falls_back_to_unfiltered_search(index):
+    tool = QueryKnowledgeBaseTool(query_input='کلاه کاسکت', brand='Arai')
+    result = asyncio.run(tool(None, query_vector=query_vector()))
+    assert result.startswith('⚠️')
+    assert 'LS2' in result and 'Shoei' in result
+
+def test_fallback_keeps_the_other_filters(index):
+    tool = QueryKnowledgeBaseTool(query_input='کلاه کاسکت', brand='Arai', price_min=10 ** 12)
+    result = asyncio.run(tool(None, query_vector=query_vector()))
+    assert result == '❌ محصولی پیدا نشد'
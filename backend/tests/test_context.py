@@ -0,0 +1,58 @@
+import asyncio
+import pytest
+from app.assistants import context as context_module
+from app.assistants.context import ContextBuilder
+
+SYSTEM_MESSAGES = [{'role': 'system', 'content': 'You are a helpful assistant.'}]
+
+
+def make_chat(n_messages, offset=0, covered=0):
+    messages = [
+        {'role': 'user' if i % 2 == 0 else 'assistant', 'content': f'message {offset + i}'}
+        for i in range(n_messages)
+    ]
+    return {'messages': messages, 'offset': offset, 'summary': {'content': '', 'covered': covered}}
+
+@pytest.fixture
+def summaries(monkeypatch):
+    calls = []
+
+    async def fake_chat_completion(messages, **kwargs):
+        calls.append(messages)
+        return 'summary'
+
+    monkeypatch.setattr(context_module, 'chat_completion', fake_chat_completion)
+    return calls
+
+def build(chat, summary_batch_size):
+    context = ContextBuilder(history_size=5, summary_batch_size=summary_batch_size)
+    context.build(SYSTEM_MESSAGES, chat, 'new question')
+    return context
+
+@pytest.mark.parametrize('n_messages, expected_pending, due', [(6, 1, False), (8, 3, False), (9, 4, True)])
+def test_summary_waits_for_a_batch(summaries, n_messages, expected_pending, due):
+    context = build(make_chat(n_messages), summary_batch_size=4)
+    assert len(context.pending) == expected_pending
+
+    summary = asyncio.run(context.summarize())
+    if due:
+        assert summary == {'content': 'summary', 'covered': expected_pending}
+        assert len(summaries) == 1
+    else:
+        assert summary is None
+        assert not summaries
+
+def test_pending_messages_are_kept_until_summarized(summaries):
+    # messages left out of a skipped summary are pending again on the next turn
+    context = build(make_chat(8), summary_batch_size=4)
+    assert asyncio.run(context.summarize()) is None
+    context = build(make_chat(10), summary_batch_size=4)
+    assert [m['content'] for m in context.pending] == [f'message {i}' for i in range(5)]
+    assert asyncio.run(context.summarize())['covered'] == 5
+
+@pytest.mark.parametrize('covered, due', [(12, False), (11, True)])
+def test_summary_runs_before_messages_leave_the_fetched_window(summaries, covered, due):
+    # ten messages are fetched per turn, so a turn later the oldest pending message may no longer be read
+    context = build(make_chat(10, offset=10, covered=covered), summary_batch_size=8)
+    assert len(context.pending) < 8
+    assert (asyncio.run(context.summarize()) is not None) == due
@@ -0,0 +1,57 @@
+from itertools import islice
+import pytest
+from app.loader import process_docs
+from app.openai import token_size
+from app.utils.splitter import TextSplitter
+from app.config import settings
+
+N_DOCS = 200
+
+
+def reference_split(splitter, text):
+    """The splitter before split token counts were reused: every candidate concatenation is encoded."""
+    def split_recursive(text, level=0):
+        if token_size(text) <= splitter.chunk_size or level == len(splitter.splitters):
+            return [text]
+        splits = []
+        for s in splitter.splitters[level](text):
+            if token_size(s) <= splitter.chunk_size:
+                splits.append(s)
+            else:
+                splits.extend(split_recursive(s, level + 1))
+        return splits
+
+    chunks = []
+    current_chunk = ''
+    current_splits = []
+    for split in split_recursive(text):
+        if current_chunk and token_size(current_chunk + split) > splitter.chunk_size:
+            if current_chunk.strip():
+                chunks.append(current_chunk.strip())
+            last_splits = current_splits
+            current_splits = []
+            current_chunk = ''
+            for s in reversed(last_splits):
+                if (token_size(s + current_chunk) > splitter.chunk_overlap or
+                    token_size(s + current_chunk + split) > splitter.chunk_size
+                ):
+                    break
+                current_chunk = s + current_chunk
+                current_splits.insert(0, s)
+        current_chunk += split
+        current_splits.append(split)
+    if current_chunk.strip():
+        chunks.append(current_chunk.strip())
+    return chunks
+
+
+@pytest.fixture(scope='module')
+def catalog_texts():
+    return [doc['text'] for doc in islice(process_docs(settings.DOCS_DIR), N_DOCS)]
+
+@pytest.mark.parametrize('chunk_size, chunk_overlap', [(64, 20), (128, 40), (512, 150)])
+def test_matches_reference_splitter(catalog_texts, chunk_size, chunk_overlap):
+    splitter = TextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    for n, (text, chunks) in enumerate(zip(catalog_texts, splitter.split_batch(catalog_texts))):
+        assert [chunk for chunk, _ in chunks] == reference_split(splitter, text), f'doc {n}'
+        assert [size for _, size in chunks] == [token_size(chunk) for chunk, _ in chunks], f'doc {n}'
@@ -9,6 +9,8 @@ export async function* parseSSEStream(stream) {
   while (true) {
     const { done, value } = await sseReader.read();
     if (done) break;
+    // رویدادهای نام‌دار (مثل usage) جزو متن پاسخ نیستند
+    if (value.event) continue;
     yield value.data;
   }
 }
\ No newline at end of file